@@ -0,0 +1,351 @@
+# backend/analysis.py
+"""
+Analysis pipeline shared by the HTTP endpoints and the background job workers.
+- run_analysis():   parse -> rules -> anomaly -> ML fallback -> aggregate/enrich
+- run_clusterize(): unknown-pattern discovery over ERROR/WARN messages
+- full_view() / compact_view() / sample_page(): response shapes for /analyze
+- analyze_bytes() records each new upload in the incident history (history.py)
+Both accept an optional progress(stage, **counters) callback; each stage is also timed
+into metrics.STAGE_SECONDS.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from collections import Counter
+import hashlib, logging, os
+import statistics as st
+
+from .parser import parse_text_log, detect_format
+from .detector import apply_rules, aggregate_incidents
+from .recommender import make_summary
+from .ml import load_model, predict
+from .ml_online import FALLBACK_CONFIDENCE, current_model, current_version
+from .cache import LRUCache
+from . import history
+from . import rulesets
+from .metrics import stage, current_endpoint, MODEL_LOAD_SECONDS, BYTES_PROCESSED, LINES_PROCESSED, RULE_HITS
+
+# --- Optional modules (v2 features). We degrade gracefully if they are missing. ---
+try:
+    from .cluster import cluster_messages           # unsupervised clustering
+except Exception:
+    cluster_messages = None  # type: ignore
+
+try:
+    from .recommender import enrich_with_sop        # SOP links/snippets
+except Exception:
+    def enrich_with_sop(incidents):                 # no-op fallback
+        return incidents
+
+try:
+    from .compliance import compliance_score        # scoring
+except Exception:
+    def compliance_score(_):                        # default 100 if module not present
+        return 100
+
+
+RULES = rulesets.get().rules  # base rule set at import (backend/rules.yaml); get() follows edits
+with MODEL_LOAD_SECONDS.time(model="legacy"):
+    MODEL = load_model()
+log = logging.getLogger(__name__)
+ANALYSIS_CACHE = LRUCache(maxsize=int(os.environ.get("SMARTSUPPORT_ANALYSIS_CACHE", 16)))
+SAMPLES_SHOWN = 5    # samples per incident in a full response / references in a compact one
+SAMPLES_KEPT = int(os.environ.get("SMARTSUPPORT_SAMPLES_KEPT", 100))  # per incident, pageable from the cache
+
+Progress = Optional[Callable[..., None]]
+
+
+def fingerprint(data: bytes) -> str:
+    """Content fingerprint used to dedupe jobs and key caches."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _noop(stage: str, **counters):
+    pass
+
+
+def level_totals(lines: List[Dict[str, Any]]) -> Dict[str, int]:
+    totals: Dict[str, int] = {"TOTAL": len(lines)}
+    for ln in lines:
+        lvl = (ln.get("level") or "").upper()
+        if lvl:
+            totals[lvl] = totals.get(lvl, 0) + 1
+    return totals
+
+
+def minute_counts(lines: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Per-minute line volume keyed by 'YYYY-MM-DDTHH:MM', in time order."""
+    buckets = Counter(ln["ts"][:16] for ln in lines if ln.get("ts"))
+    return dict(sorted(buckets.items()))
+
+
+def minute_spikes(buckets: Dict[str, int]) -> List[str]:
+    """Simple anomaly detection (per-minute volume spike)."""
+    series = list(buckets.values())
+    spikes = []
+    if series:
+        med = st.median(series)
+        mad = st.median([abs(x - med) for x in series]) or 1
+        for k, c in buckets.items():
+            if k and (c - med) / mad > 6:
+                spikes.append(k)
+    return spikes
+
+
+def ml_fallback(lines: List[Dict[str, Any]], matched_ids: Set[int], model=None,
+                max_samples: int = SAMPLES_SHOWN, minutes: Optional[Counter] = None) -> List[Dict]:
+    """ML fallback for non-rule WARN/ERROR lines; minutes (optional) counts (ts[:16], label, service)."""
+    model = current_model(fallback=MODEL) if model is None else model
+    if not model:
+        return []
+    to_pred = [
+        ln for ln in lines
+        if id(ln) not in matched_ids and (ln.get("level") or "").upper() in {"WARN", "ERROR"}
+    ]
+    preds = predict(model, [ln.get("message", "") for ln in to_pred])
+    by_label: Dict[str, Dict] = {}
+    for ln, pr in zip(to_pred, preds):
+        if pr.get("confidence", 0) < FALLBACK_CONFIDENCE:
+            continue
+        b = by_label.setdefault(
+            pr["label"],
+            {
+                "label": pr["label"],
+                "severity": "Medium",
+                "confidence": pr["confidence"],
+                "count": 0,
+                "samples": [],
+                "why": {"model": "vector-clf"},
+                "root_cause": "Model-predicted category",
+                "recommend": [
+                    "Investigate recent changes",
+                    "Check related service logs"
+                ],
+            },
+        )
+        b["count"] += 1
+        if minutes is not None:
+            minutes[((ln.get("ts") or "")[:16], str(pr["label"]), ln.get("service") or "")] += 1
+        if len(b["samples"]) < max_samples:
+            b["samples"].append(ln)
+    return list(by_label.values())
+
+
+def partial_analysis(raw: str, progress: Progress = None, max_samples: int = SAMPLES_SHOWN,
+                     minutes: Optional[Counter] = None, rules=None, fmt=None) -> Dict[str, Any]:
+    """
+    The per-record part of the pipeline (parse, rules, ML, aggregation). Its output is additive:
+    partials of consecutive chunks merge into the partial of the whole input (coordinator.merge).
+    fmt: a parser format or name (default: detected from raw)
+    """
+    progress = progress or _noop
+    rules = rulesets.get().rules if rules is None else rules
+
+    progress("parse", bytes_parsed=0)
+    with stage("parse"):
+        fmt = detect_format(raw) if fmt is None else fmt
+        lines = parse_text_log(raw, progress=lambda n, i: progress("parse", bytes_parsed=n, lines_parsed=i), fmt=fmt)
+        totals = level_totals(lines)
+    LINES_PROCESSED.inc(len(lines), endpoint=current_endpoint())
+
+    progress("rules", lines_parsed=len(lines))
+    with stage("rules"):
+        hits = apply_rules(lines, rules)
+        matched_ids: Set[int] = {id(ln) for ln, _ in hits}
+        if minutes is not None:
+            minutes.update(((ln.get("ts") or "")[:16], m[0]["label"], ln.get("service") or "") for ln, m in hits)
+    RULE_HITS.inc(len(hits), endpoint=current_endpoint())
+    progress("anomaly", lines_matched=len(hits))
+    with stage("anomaly"):
+        timeline = minute_counts(lines)
+
+    progress("ml")
+    with stage("predict"):
+        ml_incidents = ml_fallback(lines, matched_ids, max_samples=max_samples, minutes=minutes)
+
+    progress("aggregate")
+    with stage("aggregate"):
+        incidents = aggregate_incidents(hits, max_samples=max_samples)
+        incidents.extend(ml_incidents)
+
+    return {
+        "incidents": incidents,
+        "totals": totals,
+        "timeline": timeline,
+        "format": fmt if isinstance(fmt, str) else fmt.name,
+    }
+
+
+def finish_analysis(part: Dict[str, Any]) -> Dict[str, Any]:
+    """Whole-input steps on a (merged) partial: spikes, SOP enrichment, summary, compliance."""
+    with stage("anomaly"):
+        spikes = minute_spikes(part["timeline"])
+    with stage("enrich"):
+        incidents = enrich_with_sop(part["incidents"])
+        summary = make_summary(incidents, part["totals"])
+
+    return {
+        "incidents": incidents,
+        "totals": part["totals"],
+        "summary": summary,
+        "anomaly": {"spikes": spikes},
+        "timeline": part["timeline"],
+        "compliance": {"score": compliance_score(incidents)},
+        "format": part["format"],
+    }
+
+
+def run_analysis(raw: str, progress: Progress = None, max_samples: int = SAMPLES_SHOWN,
+                 minutes: Optional[Counter] = None, rules=None) -> Dict[str, Any]:
+    """
+    Full /analyze pipeline over decoded log text; keeps up to max_samples lines per incident.
+    minutes (optional) is filled with incident lines per (ts[:16], label, service) for history.record().
+    rules: compiled rules to apply (default: the base set)
+    """
+    return finish_analysis(partial_analysis(raw, progress, max_samples, minutes, rules))
+
+
+def analyze_bytes(data: bytes, tenant: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Decode and analyse an upload with a tenant's rule set (rulesets.get; raises RuleSetError),
+    memoised on content fingerprint, model version, tenant and rule-set version (the tenant is
+    part of the key so each tenant's analysis is recorded in the history under its own name).
+    The cached payload keeps SAMPLES_KEPT samples per incident; shape it with full_view/compact_view.
+    """
+    fp = fingerprint(data)
+    version = current_version()
+    ruleset = rulesets.get(tenant)
+    tenant = tenant or rulesets.BASE
+    key = (fp, version, tenant, ruleset.version)
+    payload = ANALYSIS_CACHE.get(key)
+    if payload is None:
+        BYTES_PROCESSED.inc(len(data), endpoint=current_endpoint())
+        with stage("decode"):
+            raw = data.decode(errors="ignore")
+        minutes: Counter = Counter()
+        payload = run_analysis(raw, max_samples=SAMPLES_KEPT, minutes=minutes, rules=ruleset.rules)
+        payload["ruleset"] = {"name": tenant, "version": ruleset.version}
+        ANALYSIS_CACHE.put(key, payload)
+        record_history(fp, payload, minutes, version)
+    return fp, payload
+
+
+def record_history(fp: str, payload: Dict[str, Any], minutes: Counter, version: Optional[int] = None):
+    """
+    Best effort: a history failure is logged, never surfaced to the analysis caller.
+    The analysis is recorded under the rule set in payload["ruleset"] (the tenant).
+    """
+    if not history.HISTORY_ENABLED:
+        return
+    tenant = (payload.get("ruleset") or {}).get("name") or rulesets.BASE
+    try:
+        with stage("history"):
+            history.record(fp, payload, minutes, model_version=version, tenant=tenant)
+    except Exception:
+        log.exception("failed to record analysis %s in history", fp[:12])
+
+
+def cached_analysis(fp: str, tenant: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    return ANALYSIS_CACHE.get((fp, current_version(), tenant or rulesets.BASE, rulesets.get(tenant).version))
+
+
+def full_view(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The original /analyze shape: SAMPLES_SHOWN full samples per incident."""
+    incidents = [{**inc, "samples": inc["samples"][:SAMPLES_SHOWN]} for inc in payload["incidents"]]
+    return {**payload, "incidents": incidents, "summary": make_summary(incidents, payload["totals"])}
+
+
+def _ref(ln: Dict[str, Any]) -> Dict[str, Any]:
+    return {"lineno": ln.get("lineno"), "offset": ln.get("offset")}
+
+
+def hour_counts(minutes: Dict[str, int]) -> Dict[str, int]:
+    """Per-minute timeline downsampled to hours, keyed by 'YYYY-MM-DDTHH'."""
+    hours: Dict[str, int] = {}
+    for minute, n in minutes.items():
+        hours[minute[:13]] = hours.get(minute[:13], 0) + n
+    return hours
+
+
+def compact_view(fp: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Incident summaries with sample references instead of sample bodies; summary.top holds
+    indexes into incidents and the per-minute timeline is replaced by hourly counts.
+    Samples are fetched with sample_page() using the fingerprint; they are served from this
+    process's ANALYSIS_CACHE only, so with several server workers a page request can miss.
+    """
+    incidents = []
+    for inc in payload["incidents"]:
+        row = {k: v for k, v in inc.items() if k != "samples"}
+        row["samples_available"] = len(inc["samples"])
+        row["sample_refs"] = [_ref(ln) for ln in inc["samples"][:SAMPLES_SHOWN]]
+        incidents.append(row)
+    summary = payload["summary"]
+    return {
+        **{k: v for k, v in payload.items() if k != "timeline"},
+        "fingerprint": fp,
+        "incidents": incidents,
+        "summary": {**summary, "top": list(range(len(summary.get("top", []))))},
+        "timeline_hourly": hour_counts(payload.get("timeline", {})),
+        "samples_cache": "per-process",
+    }
+
+
+def sample_page(payload: Dict[str, Any], index: int, offset: int = 0, limit: int = 20) -> Optional[Dict[str, Any]]:
+    """One page of an incident's retained samples; None if the index is out of range."""
+    if not 0 <= index < len(payload["incidents"]):
+        return None
+    inc = payload["incidents"][index]
+    samples = inc["samples"]
+    page = samples[offset:offset + limit]
+    return {
+        "incident": index,
+        "label": inc["label"],
+        "count": inc["count"],
+        "available": len(samples),
+        "offset": offset,
+        "next_offset": offset + len(page) if offset + len(page) < len(samples) else None,
+        "samples": page,
+    }
+
+
+def run_clusterize(raw: str, progress: Progress = None, rules=None) -> Dict[str, Any]:
+    """Cluster ERROR/WARN messages and flag clusters no rule recognises (rules: default the base set)."""
+    if cluster_messages is None:
+        raise RuntimeError("Clustering module not available. Install extras and add backend/cluster.py.")
+    progress = progress or _noop
+    rules = rulesets.get().rules if rules is None else rules
+
+    progress("parse", bytes_parsed=0)
+    with stage("parse"):
+        lines = parse_text_log(raw, progress=lambda n, i: progress("parse", bytes_parsed=n, lines_parsed=i))
+        msgs = [ln.get("message", "") for ln in lines if (ln.get("level") or "").upper() in {"ERROR", "WARN"}]
+    LINES_PROCESSED.inc(len(lines), endpoint=current_endpoint())
+
+    progress("cluster", lines_parsed=len(lines))
+    with stage("cluster"):
+        result = cluster_messages(msgs)
+
+    # mark "new error pattern" clusters = not matched by rules
+    progress("rules")
+    with stage("rules"):
+        hits = apply_rules(lines, rules)
+    progress("aggregate", lines_matched=len(hits))
+    matched_texts = {t[0]["message"] for t in hits}
+    clusters: Dict[int, Dict] = {}
+    for msg, label in zip(msgs, result.get("labels", [])):
+        if label == -1:
+            continue
+        c = clusters.setdefault(label, {"count": 0, "samples": [], "known": False})
+        c["count"] += 1
+        if len(c["samples"]) < 5:
+            c["samples"].append(msg)
+        if msg in matched_texts:
+            c["known"] = True
+
+    unknown = {k: v for k, v in clusters.items() if not v["known"]}
+    return {
+        "summary": {"clusters": len(clusters), "unknown": len(unknown)},
+        "clusters": clusters,
+        "unknown": unknown,
+        "raw": result,
+    }
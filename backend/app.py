@@ -1,23 +1,28 @@
-from fastapi import FastAPI, UploadFile, File, Body
+from fastapi import FastAPI, UploadFile, File, Body, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
-from typing import Dict, Set, Optional
-from collections import Counter
-import time, json
+from fastapi.responses import JSONResponse, FileResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from starlette.routing import Match
+from typing import Optional
+import hashlib, time
 
 # --- Core modules (present in your repo) ---
 from .parser import parse_text_log
-from .detector import load_rules, apply_rules, aggregate_incidents
-from .recommender import make_summary
-from .ml import load_model, predict
-from .pdf_report import generate_summary_pdf
+from .pdf_report import render_summary_pdf
+from .detector import rule_profile
+from .analysis import (ANALYSIS_CACHE, analyze_bytes, run_clusterize, fingerprint, cluster_messages,
+                       cached_analysis, full_view, compact_view, sample_page)
+from .cache import LRUCache
+from .feedback_store import FeedbackStore
+from . import ml_online
+from . import jobs
+from . import history
+from . import metrics
+from . import rulesets
+from .metrics import stage
+from .rulesets import RuleSetError
 
 # --- Optional modules (v2 features). We degrade gracefully if they are missing. ---
-try:
-    from .cluster import cluster_messages           # unsupervised clustering
-except Exception:
-    cluster_messages = None  # type: ignore
-
 try:
     from .sop_index import build_index              # SOP reindex
 except Exception:
@@ -29,16 +34,9 @@ except Exception:
     answer = None  # type: ignore
 
 try:
-    from .recommender import enrich_with_sop        # SOP links/snippets
-except Exception:
-    def enrich_with_sop(incidents):                 # no-op fallback
-        return incidents
-
-try:
-    from .compliance import compliance_score        # scoring
+    import orjson                                   # fast JSON encoding
 except Exception:
-    def compliance_score(_):                        # default 100 if module not present
-        return 100
+    orjson = None  # type: ignore
 
 
 app = FastAPI(title="SmartSupport API", version="0.2.0")
@@ -51,9 +49,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-RULES = load_rules("backend/rules.yaml")
-MODEL = load_model()
 FEEDBACK_PATH = "backend/feedback.jsonl"
+FEEDBACK = FeedbackStore(FEEDBACK_PATH)
+REPORT_CACHE = LRUCache(maxsize=16)  # (fingerprint, model version, rule set version, per_service) -> PDF bytes
+metrics.register_cache("analysis", ANALYSIS_CACHE)
+metrics.register_cache("report", REPORT_CACHE)
+metrics.register_cache("rulesets", rulesets.COMPILED)
+metrics.CallbackMetric("smartsupport_ruleset_cache_bytes", "Approximate memory held by compiled rule sets", (),
+                       lambda: {(): rulesets.cache_info()["bytes"]})
+
+
+# ---------------------------
+# Metrics & profiling
+# ---------------------------
+def _route_path(scope) -> str:
+    # route template ("/jobs/{job_id}") keeps label cardinality bounded
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+@app.middleware("http")
+async def _instrument(request: Request, call_next):
+    endpoint = _route_path(request.scope)
+    token = metrics.set_endpoint(endpoint)
+    t0 = time.perf_counter()
+    prof = None
+    try:
+        if metrics.PROFILING_ENABLED and request.headers.get("x-profile") == "1":
+            with metrics.SamplingProfiler(f"{request.method} {endpoint}") as prof:
+                response = await call_next(request)
+        else:
+            response = await call_next(request)
+    finally:
+        metrics.reset_endpoint(token)
+    dt = time.perf_counter() - t0
+    metrics.REQUEST_SECONDS.observe(dt, method=request.method, endpoint=endpoint, status=response.status_code)
+    response.headers.append("Server-Timing", f"app;dur={dt * 1e3:.1f}")
+    if prof is not None:
+        response.headers["X-Profile-Path"] = prof.dump()
+    return response
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 # ---------------------------
@@ -65,94 +107,149 @@ def health():
 
 
 @app.get("/rules")
-def rules():
+def rules(tenant: Optional[str] = Query(None)):
+    try:
+        ruleset = rulesets.get(tenant)
+    except RuleSetError as e:
+        return _bad_request(e)
     return [{
         "id": r.id,
         "pattern": r.pattern.pattern,
         "label": r.label,
-        "severity": r.severity
-    } for r in RULES]
+        "severity": r.severity,
+        "max_len": r.max_len,
+        "stats": r.stats.to_dict(),
+        "lint": r.lint,
+    } for r in ruleset.rules]
+
+
+@app.get("/rules/profile")
+def rules_profile(tenant: Optional[str] = Query(None)):
+    # which rules dominate apply_rules cost since the set was compiled
+    try:
+        return rule_profile(rulesets.get(tenant).rules)
+    except RuleSetError as e:
+        return _bad_request(e)
+
+
+@app.get("/rulesets")
+def rulesets_status():
+    # rule set names usable as ?tenant=, plus the compiled-set cache (bytes, compile time, versions)
+    return {"available": rulesets.available(), "cache": rulesets.cache_info()}
 
 
 # ---------------------------
 # Analyze
 # ---------------------------
+class FastJSONResponse(JSONResponse):
+    # orjson is several times faster than json.dumps on large analysis payloads
+    def render(self, content) -> bytes:
+        if orjson is None:
+            return super().render(content)
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY, default=str)
+
+
+def encoded(content, endpoint: str) -> FastJSONResponse:
+    """Encode once, recording size and encode time (metrics + response headers)."""
+    t0 = time.perf_counter()
+    with stage("serialize"):
+        response = FastJSONResponse(content=content)
+    dt = time.perf_counter() - t0
+    metrics.RESPONSE_BYTES.observe(len(response.body), endpoint=endpoint)
+    response.headers["X-Encode-Ms"] = f"{dt * 1e3:.2f}"
+    response.headers.append("Server-Timing", f"encode;dur={dt * 1e3:.1f}")
+    return response
+
+
 @app.post("/analyze")
-async def analyze(file: UploadFile = File(...)):
-    raw = (await file.read()).decode(errors="ignore")
-    lines = parse_text_log(raw)
-
-    # Totals by level
-    totals: Dict[str, int] = {"TOTAL": len(lines)}
-    for ln in lines:
-        lvl = (ln.get("level") or "").upper()
-        if lvl:
-            totals[lvl] = totals.get(lvl, 0) + 1
-
-    # Rule hits
-    hits = apply_rules(lines, RULES)
-    matched_ids: Set[int] = {id(ln) for ln, _ in hits}
-
-    # Simple anomaly detection (per-minute volume spike)
-    def minute_bucket(ts): return ts[:16] if ts else None
-    buckets = Counter(minute_bucket(ln.get("ts")) for ln in lines if ln.get("ts"))
-    series = [c for _, c in sorted(buckets.items())]
-    spikes = []
-    if series:
-        import statistics as st
-        med = st.median(series)
-        mad = st.median([abs(x - med) for x in series]) or 1
-        for k, c in sorted(buckets.items()):
-            if k and (c - med) / mad > 6:
-                spikes.append(k)
-
-    # ML fallback for non-rule WARN/ERROR lines
-    ml_incidents = []
-    if MODEL:
-        to_pred = [
-            ln for ln in lines
-            if id(ln) not in matched_ids and (ln.get("level") or "").upper() in {"WARN", "ERROR"}
-        ]
-        preds = predict(MODEL, [ln.get("message", "") for ln in to_pred])
-        by_label: Dict[str, Dict] = {}
-        for ln, pr in zip(to_pred, preds):
-            if pr.get("confidence", 0) < 0.80:
-                continue
-            b = by_label.setdefault(
-                pr["label"],
-                {
-                    "label": pr["label"],
-                    "severity": "Medium",
-                    "confidence": pr["confidence"],
-                    "count": 0,
-                    "samples": [],
-                    "why": {"model": "vector-clf"},
-                    "root_cause": "Model-predicted category",
-                    "recommend": [
-                        "Investigate recent changes",
-                        "Check related service logs"
-                    ],
-                },
-            )
-            b["count"] += 1
-            if len(b["samples"]) < 5:
-                b["samples"].append(ln)
-        ml_incidents = list(by_label.values())
-
-    # Aggregate and enrich
-    incidents = aggregate_incidents(hits)
-    incidents.extend(ml_incidents)
-    incidents = enrich_with_sop(incidents)
-    summary = make_summary(incidents, totals)
-
-    payload = {
-        "incidents": incidents,
-        "totals": totals,
-        "summary": summary,
-        "anomaly": {"spikes": spikes},
-        "compliance": {"score": compliance_score(incidents)},
-    }
-    return JSONResponse(content=payload)
+async def analyze(file: UploadFile = File(...), view: str = Query("full"), tenant: Optional[str] = Query(None)):
+    # view=compact: incident summaries with sample references and an hourly timeline; page
+    # samples via the endpoint below
+    # tenant: rule set to apply (GET /rulesets); default is the base set
+    if view not in ("full", "compact"):
+        return JSONResponse(status_code=400, content={"ok": False, "error": "view must be 'full' or 'compact'"})
+    data = await file.read()
+    try:
+        fp, payload = await run_in_threadpool(analyze_bytes, data, tenant)
+    except RuleSetError as e:
+        return _bad_request(e)
+    body = compact_view(fp, payload) if view == "compact" else full_view(payload)
+    return encoded(body, "/analyze")
+
+
+@app.get("/analyze/{fp}/incidents/{index}/samples")
+def analyze_samples(fp: str, index: int, offset: int = Query(0, ge=0), limit: int = Query(20, ge=1, le=500),
+                    tenant: Optional[str] = Query(None)):
+    # Pages come from the in-memory ANALYSIS_CACHE of the worker process that served the upload;
+    # behind several uvicorn workers a request can land elsewhere and get 404 (re-POST /analyze).
+    try:
+        payload = cached_analysis(fp, tenant)
+    except RuleSetError as e:
+        return _bad_request(e)
+    if payload is None:
+        return JSONResponse(status_code=404, content={"ok": False, "error": "Analysis not cached in this worker process; POST /analyze again"})
+    page = sample_page(payload, index, offset, limit)
+    if page is None:
+        return JSONResponse(status_code=404, content={"ok": False, "error": "Unknown incident index"})
+    return encoded({"fingerprint": fp, **page}, "/analyze/{fp}/incidents/{index}/samples")
+
+
+# ---------------------------
+# Incident history (across uploads)
+# ---------------------------
+def _bad_request(e: Exception) -> JSONResponse:
+    return JSONResponse(status_code=400, content={"ok": False, "error": str(e)})
+
+
+@app.get("/history/trend")
+def history_trend(
+    label: Optional[str] = None,
+    service: Optional[str] = None,
+    since: Optional[str] = None,     # epoch seconds or ISO-8601
+    until: Optional[str] = None,
+    bucket: str = Query("hour"),     # minute | hour | day | week
+    tenant: str = Query(rulesets.BASE),
+):
+    try:
+        points = history.trend(label=label, service=service, since=history.as_epoch(since),
+                               until=history.as_epoch(until), bucket=bucket, tenant=tenant)
+    except ValueError as e:
+        return _bad_request(e)
+    return {"label": label, "service": service, "bucket": bucket, "tenant": tenant, "points": points}
+
+
+@app.get("/history/top")
+def history_top(
+    by: str = Query("label"),        # label | service
+    label: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    tenant: str = Query(rulesets.BASE),
+):
+    try:
+        items = history.top(by=by, label=label, since=history.as_epoch(since),
+                            until=history.as_epoch(until), limit=limit, tenant=tenant)
+    except ValueError as e:
+        return _bad_request(e)
+    return {"by": by, "tenant": tenant, "items": items}
+
+
+@app.get("/history/occurrences")
+def history_occurrences(
+    label: str,
+    service: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    tenant: Optional[str] = None,    # only analyses run with this rule set
+):
+    try:
+        items = history.occurrences(label, service=service, since=history.as_epoch(since),
+                                    until=history.as_epoch(until), limit=limit, tenant=tenant)
+    except ValueError as e:
+        return _bad_request(e)
+    return {"label": label, "count": len(items), "items": items}
 
 
 # ---------------------------
@@ -161,33 +258,70 @@ async def analyze(file: UploadFile = File(...)):
 @app.post("/feedback")
 def feedback(item: dict = Body(...)):
     item["ts"] = time.time()
-    with open(FEEDBACK_PATH, "a") as f:
-        f.write(json.dumps(item) + "\n")
-    return {"ok": True}
+    queued = FEEDBACK.append(item)
+    return {"ok": True, "duplicate": not queued}
+
+
+@app.get("/feedback")
+def feedback_query(
+    cluster_id: Optional[str] = None,
+    label: Optional[str] = None,
+    type: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    items = FEEDBACK.query(cluster_id=cluster_id, label=label, type=type, since=since, until=until, limit=limit)
+    return {"count": len(items), "items": items}
+
+
+@app.post("/feedback/compact")
+def feedback_compact():
+    return {"ok": True, **FEEDBACK.compact()}
 
 
 # ---------------------------
-# PDF Report
+# Model (online classifier)
 # ---------------------------
-@app.post("/report")
-async def report(file: UploadFile = File(...)):
-    raw = (await file.read()).decode(errors="ignore")
-    lines = parse_text_log(raw)
+@app.get("/model")
+def model_status():
+    reg = ml_online.load_registry()
+    return {"current": ml_online.current_version(), "versions": reg["versions"][-10:]}
 
-    totals: Dict[str, int] = {"TOTAL": len(lines)}
-    for ln in lines:
-        lvl = (ln.get("level") or "").upper()
-        if lvl:
-            totals[lvl] = totals.get(lvl, 0) + 1
 
-    hits = apply_rules(lines, RULES)
-    incidents = aggregate_incidents(hits)
-    incidents = enrich_with_sop(incidents)
-    summary = make_summary(incidents, totals)
+@app.post("/model/train")
+async def model_train(min_delta: float = Query(0.02), max_churn: float = Query(0.02, ge=0, le=1)):
+    # folds feedback received since the current version into a new model version
+    return await run_in_threadpool(ml_online.train_incremental, store=FEEDBACK, min_delta=min_delta,
+                                   max_churn=max_churn)
 
-    data = {"incidents": incidents, "totals": totals, "summary": summary}
-    pdf_path = generate_summary_pdf(data)
-    return FileResponse(pdf_path, filename="SmartSupport_Report.pdf", media_type="application/pdf")
+
+# ---------------------------
+# PDF Report
+# ---------------------------
+@app.post("/report")
+async def report(file: UploadFile = File(...), per_service: bool = Query(False), tenant: Optional[str] = Query(None)):
+    data = await file.read()
+    try:
+        ruleset = rulesets.get(tenant)
+    except RuleSetError as e:
+        return _bad_request(e)
+    key = (fingerprint(data), ml_online.current_version(), ruleset.version, per_service)
+    pdf = REPORT_CACHE.get(key)
+    if pdf is None:
+        # reuses the cached /analyze result for this upload; reportlab runs off the event loop
+        def build() -> bytes:
+            payload = analyze_bytes(data, tenant)[1]
+            with stage("pdf"):
+                return render_summary_pdf(payload, per_service=per_service)
+
+        pdf = await run_in_threadpool(build)
+        REPORT_CACHE.put(key, pdf)
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="SmartSupport_Report.pdf"'},
+    )
 
 
 # ---------------------------
@@ -204,39 +338,19 @@ async def ingest(payload: dict = Body(...)):
 # Clusterize (unknown pattern discovery)
 # ---------------------------
 @app.post("/clusterize")
-async def clusterize(file: UploadFile = File(...)):
+async def clusterize(file: UploadFile = File(...), tenant: Optional[str] = Query(None)):
     if cluster_messages is None:
         return JSONResponse(
             status_code=501,
             content={"ok": False, "error": "Clustering module not available. Install extras and add backend/cluster.py."},
         )
+    try:
+        rules = rulesets.get(tenant).rules
+    except RuleSetError as e:
+        return _bad_request(e)
 
     raw = (await file.read()).decode(errors="ignore")
-    lines = parse_text_log(raw)
-    msgs = [ln.get("message", "") for ln in lines if (ln.get("level") or "").upper() in {"ERROR", "WARN"}]
-    result = cluster_messages(msgs)
-
-    # mark "new error pattern" clusters = not matched by rules
-    hits = apply_rules(lines, RULES)
-    matched_texts = {t[0]["message"] for t in hits}
-    clusters: Dict[int, Dict] = {}
-    for msg, label in zip(msgs, result.get("labels", [])):
-        if label == -1:
-            continue
-        c = clusters.setdefault(label, {"count": 0, "samples": [], "known": False})
-        c["count"] += 1
-        if len(c["samples"]) < 5:
-            c["samples"].append(msg)
-        if msg in matched_texts:
-            c["known"] = True
-
-    unknown = {k: v for k, v in clusters.items() if not v["known"]}
-    return {
-        "summary": {"clusters": len(clusters), "unknown": len(unknown)},
-        "clusters": clusters,
-        "unknown": unknown,
-        "raw": result,
-    }
+    return run_clusterize(raw, rules=rules)
 
 
 # ---------------------------
@@ -261,4 +375,72 @@ def chat(payload: dict = Body(...)):
             content={"ok": False, "error": "Chatbot not available. Add backend/chatbot.py and SOP index."},
         )
     q = payload.get("q", "")
-    return answer(q)
\ No newline at end of file
+    return answer(q)
+
+
+# ---------------------------
+# Jobs (async analyze/report/clusterize for large uploads)
+# ---------------------------
+UPLOAD_CHUNK = 1 << 20
+
+
+@app.post("/jobs")
+async def submit_job(file: UploadFile = File(...), kind: str = Query("analyze"), tenant: Optional[str] = Query(None)):
+    if kind not in jobs.KINDS:
+        return JSONResponse(status_code=400, content={"ok": False, "error": f"kind must be one of {sorted(jobs.KINDS)}"})
+    if kind == "clusterize" and cluster_messages is None:
+        return JSONResponse(status_code=501, content={"ok": False, "error": "Clustering module not available."})
+
+    # stream the upload to disk while hashing, so large logs never sit in memory here
+    spool = jobs.new_spool_path()
+    h = hashlib.sha256()
+    with open(spool, "wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK):
+            h.update(chunk)
+            f.write(chunk)
+    try:
+        job = jobs.submit(spool, h.hexdigest(), kind=kind, filename=file.filename or "", tenant=tenant)
+    except ValueError as e:  # includes RuleSetError (unknown tenant)
+        return _bad_request(e)
+    return JSONResponse(status_code=202, content=job)
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"ok": False, "error": "Unknown or expired job"})
+    return job
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"ok": False, "error": "Unknown or expired job"})
+    if job["status"] != "done":
+        return JSONResponse(status_code=409, content={"ok": False, "status": job["status"], "error": job["error"]})
+    return FileResponse(jobs.result_path(job_id), media_type="application/json")
+
+
+@app.get("/jobs/{job_id}/report")
+def job_report(job_id: str):
+    job = jobs.get(job_id)
+    if job is None or job["kind"] != "report":
+        return JSONResponse(status_code=404, content={"ok": False, "error": "Unknown or expired report job"})
+    if job["status"] != "done":
+        return JSONResponse(status_code=409, content={"ok": False, "status": job["status"], "error": job["error"]})
+    return FileResponse(jobs.result_path(job_id, "report.pdf"), filename="SmartSupport_Report.pdf",
+                        media_type="application/pdf")
+
+
+@app.on_event("startup")
+def _startup():
+    # jobs left queued/running by a previous server process will never finish
+    jobs.recover_stale()
+
+
+@app.on_event("shutdown")
+def _shutdown():
+    jobs.shutdown()
+    FEEDBACK.close()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# backend/bench.py
+"""
+End-to-end benchmark: each pipeline stage plus the HTTP endpoints.
+    python -m backend.bench --size 200M --out bench.json
+    python -m backend.bench --input big.log --baseline bench.json      # compare against a baseline
+    python -m backend.bench --url http://localhost:8000 --skip-stages  # HTTP against a live server
+    python -m backend.bench --skip-stages --skip-http                  # parser formats only
+    python -m backend.bench --workers 1,2,4,8 --skip-stages --skip-formats --skip-http  # scale-out only
+Records seconds, lines/sec, MB/sec and peak RSS per stage, parse lines/sec per log format,
+coordinator throughput per worker count, latency percentiles per endpoint, and writes them
+as JSON so runs can be compared (--baseline, --max-regression).
+"""
+import argparse, json, os, platform, resource, statistics, subprocess, sys, tempfile, time
+from typing import Any, Callable, Dict, List, Optional
+
+from .synth import stream_log
+from .generate_stress_log import parse_size
+
+
+def peak_rss_mb() -> float:
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(kb / (1 << 20) if sys.platform == "darwin" else kb / 1024, 1)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(round(q * (len(s) - 1))))]
+    return {
+        "n": len(s),
+        "p50_ms": round(pick(0.50) * 1e3, 2),
+        "p90_ms": round(pick(0.90) * 1e3, 2),
+        "p99_ms": round(pick(0.99) * 1e3, 2),
+        "max_ms": round(s[-1] * 1e3, 2),
+        "mean_ms": round(statistics.fmean(s) * 1e3, 2),
+    }
+
+
+class Stages:
+    def __init__(self, n_lines: int, n_bytes: int):
+        self.n_lines, self.n_bytes = n_lines, n_bytes
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def run(self, name: str, fn: Callable[[], Any], items: Optional[int] = None):
+        t0 = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t0
+        n = self.n_lines if items is None else items
+        self.results[name] = {
+            "seconds": round(dt, 4),
+            "items": n,
+            "items_per_sec": round(n / dt, 1) if dt else None,
+            "mb_per_sec": round(self.n_bytes / dt / (1 << 20), 2) if dt and items is None else None,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+        print(f"  {name:<12} {dt:9.3f}s  {self.results[name]['items_per_sec'] or 0:>12,.0f}/s  "
+              f"rss {self.results[name]['peak_rss_mb']}MB", flush=True)
+        return out
+
+
+def bench_stages(path: str, cluster_cap: int, sop_queries: int) -> Dict[str, Any]:
+    from .parser import parse_text_log
+    from .detector import apply_rules, aggregate_incidents
+    from .analysis import (RULES, ml_fallback, minute_counts, minute_spikes, enrich_with_sop,
+                           cluster_messages, run_analysis)
+    from .recommender import make_summary
+    from .pdf_report import render_summary_pdf
+
+    n_bytes = os.path.getsize(path)
+    st = Stages(0, n_bytes)
+    raw = st.run("read_decode", lambda: open(path, "rb").read().decode(errors="ignore"), items=0)
+    lines = st.run("parse", lambda: parse_text_log(raw), items=raw.count("\n"))
+    st.n_lines = len(lines)
+    hits = st.run("rules", lambda: apply_rules(lines, RULES))
+    st.run("anomaly", lambda: minute_spikes(minute_counts(lines)))
+    matched = {id(ln) for ln, _ in hits}
+    to_pred = sum(1 for ln in lines if id(ln) not in matched and (ln.get("level") or "") in {"WARN", "ERROR"})
+    ml = st.run("ml_fallback", lambda: ml_fallback(lines, matched), items=to_pred)
+    incidents = st.run("aggregate", lambda: enrich_with_sop(aggregate_incidents(hits) + ml), items=len(hits))
+
+    if cluster_messages is not None:
+        msgs = [ln["message"] for ln in lines if (ln.get("level") or "") in {"ERROR", "WARN"}][:cluster_cap]
+        st.run("cluster", lambda: cluster_messages(msgs), items=len(msgs))
+    try:
+        from .sop_index import search
+        queries = [inc["label"] for inc in incidents] or ["database timeout"]
+        qs = (queries * (sop_queries // len(queries) + 1))[:sop_queries]
+        st.run("sop_search", lambda: [search(q) for q in qs], items=len(qs))
+    except Exception as e:  # index or deps missing
+        print(f"  sop_search skipped: {e}")
+
+    payload = {"incidents": incidents, "totals": {"TOTAL": len(lines)},
+               "summary": make_summary(incidents, {"TOTAL": len(lines)}), "timeline": minute_counts(lines)}
+    st.run("pdf", lambda: render_summary_pdf(payload), items=len(incidents))
+    del raw, lines, hits
+    # the whole pipeline as /analyze runs it, for an end-to-end number
+    st.run("end_to_end", lambda: run_analysis(open(path, "rb").read().decode(errors="ignore")),
+           items=st.n_lines)
+    return {"input_bytes": n_bytes, "records": st.n_lines, "stages": st.results}
+
+
+def render_formats(text: str) -> Dict[str, str]:
+    """The same records written in every built-in format (plus python_logging from log_formats.yaml)."""
+    import json
+    from .parser import parse_text_log
+    sev = {"ERROR": 3, "WARN": 4, "INFO": 6, "DEBUG": 7}
+    recs = [r for r in parse_text_log(text, fmt="default") if r["ts"]]
+    q = lambda m: '"' + m.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    out = {"default": text}
+    out["jsonl"] = "\n".join(json.dumps({"ts": r["ts"], "level": r["level"], "service": r["service"],
+                                          "host": r["host"], "msg": r["message"]}) for r in recs) + "\n"
+    out["logfmt"] = "\n".join(f"ts={r['ts']} level={r['level'].lower()} service={r['service']} host={r['host']} "
+                              f"msg={q(r['message'].splitlines()[0])}" for r in recs) + "\n"
+    out["syslog"] = "\n".join(f"<{8 + sev.get(r['level'], 6)}>1 {r['ts']} {r['host']} {r['service']} - - - {r['message']}"
+                              for r in recs) + "\n"
+    out["python_logging"] = "\n".join(f"{r['ts'][:10]} {r['ts'][11:19]},000 {r['level']} {r['service']}: {r['message']}"
+                                      for r in recs) + "\n"
+    return out
+
+
+def bench_formats(lines: int, repeat: int = 3) -> Dict[str, Any]:
+    """Detection time and parse throughput (best of `repeat`) per format, on identical records."""
+    import io
+    from .parser import parse_text_log, detect_format
+    buf = io.StringIO()
+    stream_log(buf, lines=lines, stack_ratio=0.05)
+    out = {}
+    for name, text in render_formats(buf.getvalue()).items():
+        t0 = time.perf_counter()
+        fmt = detect_format(text)
+        detect_ms = (time.perf_counter() - t0) * 1e3
+        n_lines = text.count("\n")
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            records = parse_text_log(text, fmt=fmt)
+            best = min(best, time.perf_counter() - t0)
+        out[name] = {
+            "detected": fmt.name,
+            "detect_ms": round(detect_ms, 2),
+            "lines": n_lines,
+            "records": len(records),
+            "seconds": round(best, 4),
+            "lines_per_sec": round(n_lines / best, 1),
+            "mb_per_sec": round(len(text) / best / (1 << 20), 2),
+        }
+        flag = "" if fmt.name == name else f"  (detected as {fmt.name}!)"
+        print(f"  {name:<15} {out[name]['lines_per_sec']:>12,.0f} lines/s  {out[name]['mb_per_sec']:>7} MB/s  "
+              f"detect {out[name]['detect_ms']}ms{flag}", flush=True)
+    return out
+
+
+def bench_scaleout(path: str, counts: List[int], chunk_bytes: int) -> Dict[str, Any]:
+    """
+    Coordinator throughput with 1..N local worker processes (coordinator.py) on the same input.
+    Speedup is relative to the smallest count; efficiency = speedup / worker ratio. Worker
+    processes share this host's cores, so scaling flattens once counts exceed os.cpu_count().
+    in_process_seconds (run_analysis in this process) shows the coordinator's own overhead.
+    """
+    from .analysis import run_analysis
+    from .coordinator import analyze_file, local_workers
+    n_bytes = os.path.getsize(path)
+    out: Dict[str, Any] = {"input_bytes": n_bytes, "chunk_bytes": chunk_bytes, "cpus": os.cpu_count(), "workers": {}}
+    t0 = time.perf_counter()
+    run_analysis(open(path, "rb").read().decode(errors="ignore"))
+    out["in_process_seconds"] = round(time.perf_counter() - t0, 4)
+    print(f"  in-process  {out['in_process_seconds']:9.3f}s", flush=True)
+    with local_workers(max(counts)) as urls:
+        base = None
+        for k in sorted(counts):
+            t0 = time.perf_counter()
+            payload, _ = analyze_file(path, urls[:k], record=False, chunk_bytes=chunk_bytes)
+            dt = time.perf_counter() - t0
+            base = base or (dt, k)
+            speedup = base[0] / dt
+            records = payload["totals"].get("TOTAL", 0)
+            out["workers"][str(k)] = {
+                "seconds": round(dt, 4),
+                "chunks": payload["coordinator"]["chunks"],
+                "retries": payload["coordinator"]["retries"],
+                "records_per_sec": round(records / dt, 1),
+                "mb_per_sec": round(n_bytes / dt / (1 << 20), 2),
+                "speedup": round(speedup, 2),
+                "efficiency": round(speedup / (k / base[1]), 2),
+            }
+            r = out["workers"][str(k)]
+            print(f"  {k:>3} workers {dt:9.3f}s  {r['records_per_sec']:>12,.0f} rec/s  {r['mb_per_sec']:>7} MB/s  "
+                  f"x{r['speedup']} (eff {r['efficiency']:.0%})", flush=True)
+    return out
+
+
+def bench_http(path: str, requests: int, url: Optional[str]) -> Dict[str, Any]:
+    if url:
+        import httpx
+        client = httpx.Client(base_url=url, timeout=600)
+    else:
+        from fastapi.testclient import TestClient
+        from . import history
+        from .app import app
+        # in-process uploads (nonced, so all cache misses) would be recorded in the real incident
+        # history; record them next to the generated log instead, keeping the write in the timings
+        history.HISTORY_DB = os.path.join(os.path.dirname(os.path.abspath(path)), "history.sqlite")
+        client = TestClient(app)
+
+    with open(path, "rb") as f:
+        data = f.read()
+    endpoints = {
+        "GET /health": lambda i: client.get("/health"),
+        "GET /rules": lambda i: client.get("/rules"),
+        # a nonce line changes the fingerprint so every request misses the analysis/report caches
+        "POST /analyze": lambda i: client.post("/analyze", files={"file": ("b.log", data + b"#%d\n" % i)}),
+        "POST /report": lambda i: client.post("/report", files={"file": ("b.log", data + b"#%d\n" % i)}),
+        "POST /clusterize": lambda i: client.post("/clusterize", files={"file": ("b.log", data + b"#%d\n" % i)}),
+        "POST /chat": lambda i: client.post("/chat", json={"q": "database timeout"}),
+    }
+    out = {}
+    nonce = int(time.time())
+    for k, (name, call) in enumerate(endpoints.items()):
+        samples, status = [], None
+        for i in range(requests):
+            t0 = time.perf_counter()
+            r = call(nonce + k * requests + i)
+            samples.append(time.perf_counter() - t0)
+            status = r.status_code
+        out[name] = {"status": status, **percentiles(samples)}
+        print(f"  {name:<18} p50 {out[name]['p50_ms']:>9}ms  p99 {out[name]['p99_ms']:>9}ms  [{status}]", flush=True)
+    return {"payload_bytes": len(data), "endpoints": out}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float,
+            min_seconds: float = 0.05) -> List[str]:
+    """
+    Print deltas vs. baseline; return the regressions beyond max_regression.
+    Metrics under min_seconds in both runs are shown but never flagged (timer noise).
+    """
+    regressions = []
+    rows = []
+    for name, cur in current.get("stages", {}).get("stages", {}).items():
+        base = baseline.get("stages", {}).get("stages", {}).get(name)
+        if base and base.get("seconds"):
+            rows.append((f"stage {name}", "seconds", base["seconds"], cur["seconds"]))
+    for name, cur in current.get("formats", {}).items():
+        base = baseline.get("formats", {}).get(name)
+        if base and base.get("seconds"):
+            rows.append((f"parse {name}", "seconds", base["seconds"], cur["seconds"]))
+    for name, cur in current.get("scaleout", {}).get("workers", {}).items():
+        base = baseline.get("scaleout", {}).get("workers", {}).get(name)
+        if base and base.get("seconds"):
+            rows.append((f"scaleout {name} workers", "seconds", base["seconds"], cur["seconds"]))
+    for name, cur in current.get("http", {}).get("endpoints", {}).items():
+        base = baseline.get("http", {}).get("endpoints", {}).get(name)
+        if base:
+            rows.append((name, "p50_ms", base["p50_ms"], cur["p50_ms"]))
+            rows.append((name, "p99_ms", base["p99_ms"], cur["p99_ms"]))
+    print(f"\n{'metric':<30} {'baseline':>10} {'current':>10} {'delta':>8}")
+    for name, metric, b, c in rows:
+        delta = (c - b) / b if b else 0.0
+        floor = min_seconds * (1e3 if metric.endswith("_ms") else 1)
+        regressed = delta > max_regression and max(b, c) >= floor
+        flag = " !" if regressed else ""
+        print(f"{name + ' ' + metric:<30} {b:>10} {c:>10} {delta:>+7.1%}{flag}")
+        if regressed:
+            regressions.append(f"{name} {metric}: {b} -> {c} ({delta:+.1%})")
+    return regressions
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--input", help="existing log file (default: generate one)")
+    ap.add_argument("--size", default="50M", help="generated log size, e.g. 50M, 1G")
+    ap.add_argument("--stack-ratio", type=float, default=0.1)
+    ap.add_argument("--services", type=int, default=40)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--cluster-cap", type=int, default=20000, help="max messages sent to clustering")
+    ap.add_argument("--sop-queries", type=int, default=200)
+    ap.add_argument("--skip-stages", action="store_true")
+    ap.add_argument("--skip-http", action="store_true")
+    ap.add_argument("--skip-formats", action="store_true")
+    ap.add_argument("--format-lines", type=int, default=200000, help="records per format for the parser benchmark")
+    ap.add_argument("--skip-scaleout", action="store_true")
+    ap.add_argument("--workers", default="1,2,4", help="worker counts for the coordinator benchmark")
+    ap.add_argument("--scaleout-size", default="50M", help="generated log size for the coordinator benchmark")
+    ap.add_argument("--chunk-size", default="4M", help="coordinator chunk size")
+    ap.add_argument("--http-size", default="2M", help="payload size for endpoint requests")
+    ap.add_argument("--http-requests", type=int, default=10)
+    ap.add_argument("--url", help="benchmark a running server instead of the in-process app")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--baseline", help="compare against a previous results JSON")
+    ap.add_argument("--max-regression", type=float, default=0.2, help="fail if slower by more than this")
+    ap.add_argument("--min-seconds", type=float, default=0.05, help="ignore regressions on faster metrics")
+    args = ap.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="smartsupport-bench-")
+
+    def generated(size: str, name: str) -> str:
+        path = os.path.join(tmpdir, name)
+        t0 = time.perf_counter()
+        with open(path, "w", buffering=1 << 20) as f:
+            info = stream_log(f, size_bytes=parse_size(size), services=args.services,
+                              stack_ratio=args.stack_ratio, seed=args.seed)
+        dt = time.perf_counter() - t0
+        print(f"generated {name}: {info['bytes'] / (1 << 20):.1f}MB, {info['lines']:,} lines "
+              f"in {dt:.1f}s ({info['bytes'] / dt / (1 << 20):.1f}MB/s)", flush=True)
+        return path
+
+    result: Dict[str, Any] = {
+        "meta": {
+            "ts": time.time(),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        }
+    }
+    try:
+        if not args.skip_stages:
+            path = args.input or generated(args.size, "stages.log")
+            print("stages:")
+            result["stages"] = bench_stages(path, args.cluster_cap, args.sop_queries)
+        if not args.skip_formats:
+            print("formats:")
+            result["formats"] = bench_formats(args.format_lines)
+        if not args.skip_scaleout:
+            path = args.input or generated(args.scaleout_size, "scaleout.log")
+            print("scaleout:")
+            result["scaleout"] = bench_scaleout(path, [int(k) for k in args.workers.split(",")],
+                                                parse_size(args.chunk_size))
+        if not args.skip_http:
+            path = generated(args.http_size, "http.log")
+            print("http:")
+            result["http"] = bench_http(path, args.http_requests, args.url)
+    finally:
+        for name in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nwrote {args.out}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.max_regression, args.min_seconds)
+        if regressions:
+            print("\nregressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# backend/bench_report.py
+"""
+Benchmark PDF render time vs. incident count.
+    python -m backend.bench_report                   # default sizes
+    python -m backend.bench_report --sizes 100 1000 10000 --minutes 1440 --per-service
+Prints one row per size; us/incident should stay flat if rendering is linear.
+"""
+import argparse, json, random, time
+from datetime import datetime, timedelta
+
+from .pdf_report import render_summary_pdf
+
+SEVERITIES = ["High", "Medium", "Low"]
+SERVICES = ["api-server", "db-service", "auth-service", "scheduler", "queue-worker", "payment"]
+
+
+def synthetic_data(n_incidents: int, minutes: int = 1440, seed: int = 7):
+    rnd = random.Random(seed)
+    start = datetime(2025, 10, 15)
+    timeline = {
+        (start + timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M"): rnd.randint(5, 60) for i in range(minutes)
+    }
+    incidents = [{
+        "label": f"Pattern {i}",
+        "severity": rnd.choice(SEVERITIES),
+        "count": rnd.randint(1, 5000),
+        "service": ", ".join(rnd.sample(SERVICES, rnd.randint(1, 2))),
+        "root_cause": "Synthetic root cause " + "x" * rnd.randint(10, 120),
+        "recommend": [f"Recommendation {i % 40}"],
+    } for i in range(n_incidents)]
+    totals = {"TOTAL": sum(timeline.values()), "ERROR": n_incidents}
+    return {
+        "incidents": incidents,
+        "totals": totals,
+        "summary": {"headline": f"Found {n_incidents} incident types"},
+        "timeline": timeline,
+        "anomaly": {"spikes": list(timeline)[::97]},
+    }
+
+
+def run(sizes, minutes: int, per_service: bool, repeat: int):
+    rows = []
+    for n in sizes:
+        data = synthetic_data(n, minutes)
+        best, size = float("inf"), 0
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            pdf = render_summary_pdf(data, per_service=per_service)
+            best = min(best, time.perf_counter() - t0)
+            size = len(pdf)
+        rows.append({"incidents": n, "seconds": round(best, 4),
+                     "us_per_incident": round(best / max(1, n) * 1e6, 1), "pdf_bytes": size})
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 2000, 5000])
+    ap.add_argument("--minutes", type=int, default=1440, help="timeline length in minutes")
+    ap.add_argument("--per-service", action="store_true")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = ap.parse_args()
+
+    rows = run(args.sizes, args.minutes, args.per_service, args.repeat)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    print(f"{'incidents':>10} {'seconds':>9} {'us/inc':>9} {'pdf_bytes':>10}")
+    for r in rows:
+        print(f"{r['incidents']:>10} {r['seconds']:>9} {r['us_per_incident']:>9} {r['pdf_bytes']:>10}")
+
+
+if __name__ == "__main__":
+    main()
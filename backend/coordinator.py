@@ -0,0 +1,520 @@
+#!/usr/bin/env python3
+# backend/coordinator.py
+"""
+Coordinator/worker mode for bulk analyses (backfills) beyond one process.
+- A worker is a stdlib HTTP server: POST /chunk runs analysis.partial_analysis() on one chunk
+  and returns the partial as JSON; GET /health, GET /metrics. The work is CPU-bound Python in
+  one process, so run one worker per core (on as many hosts as you like):
+      python -m backend.coordinator worker --host 0.0.0.0 --port 9101
+- The coordinator splits the input into record-aligned chunks (a chunk never starts inside a
+  multi-line record such as a stack trace), keeps each worker busy with one chunk, retries a
+  failed chunk (on whichever worker is free next) and merges the partials in input order:
+      python -m backend.coordinator run big.log --workers http://10.0.0.5:9101,http://10.0.0.6:9101
+      python -m backend.coordinator run big.log --spawn 4 --out result.json   # local workers
+- Merged totals, minute buckets and incidents equal a single-process run_analysis() of the same
+  input; spikes, SOP enrichment and the summary run once on the merged result, and the analysis
+  is recorded in the incident history.
+- Jobs (jobs.py) use the workers listed in SMARTSUPPORT_WORKERS when it is set, and otherwise
+  run the same chunks in their own process (analyze_file with no workers).
+"""
+
+from collections import Counter, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlsplit
+import argparse, hashlib, http.client, logging, mmap, os, subprocess, sys, threading, time
+
+try:
+    import orjson                                   # fast JSON for partials
+    _dumps = lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY, default=str)
+    _loads = orjson.loads
+except Exception:
+    import json
+    _dumps = lambda obj: json.dumps(obj, default=str).encode()
+    _loads = json.loads
+
+from .analysis import partial_analysis, finish_analysis, record_history, SAMPLES_SHOWN
+from .ml_online import current_version
+from .parser import FORMATS, SNIFF_CHARS, LogFormat, detect_format
+from .rulesets import RuleSetError
+from . import metrics
+from . import rulesets
+
+log = logging.getLogger(__name__)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # rule/format paths are repo-relative
+WORKERS = [u.strip() for u in os.environ.get("SMARTSUPPORT_WORKERS", "").split(",") if u.strip()]
+CHUNK_BYTES = int(os.environ.get("SMARTSUPPORT_CHUNK_BYTES", 8 << 20))
+RETRIES = 3               # failed attempts per chunk before the run fails
+WORKER_MAX_FAILURES = 3   # consecutive failures before a worker is dropped for the rest of a run
+RETRY_BACKOFF = 0.5       # seconds x consecutive failures before a failing worker takes more work
+TIMEOUT = 600.0           # seconds per chunk request
+
+
+class CoordinatorError(RuntimeError):
+    pass
+
+
+# ---------------------------
+# Worker
+# ---------------------------
+def analyze_chunk(data: bytes, fmt: str, tenant: Optional[str] = None,
+                  max_samples: int = SAMPLES_SHOWN) -> Dict[str, Any]:
+    """Partial analysis of one chunk plus what the coordinator needs to merge it."""
+    t0 = time.perf_counter()
+    ruleset = rulesets.get(tenant)
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+    with metrics.stage("decode"):
+        text = data.decode(errors="ignore")
+    seen = {"lines": 0, "matched": 0}
+
+    def progress(stage: str, **counters):
+        if stage == "parse" and "lines_parsed" in counters:
+            seen["lines"] = counters["lines_parsed"]
+        if "lines_matched" in counters:
+            seen["matched"] = counters["lines_matched"]
+
+    minutes: Counter = Counter()
+    part = partial_analysis(text, progress=progress, max_samples=max_samples, minutes=minutes,
+                            rules=ruleset.rules, fmt=fmt)
+    metrics.BYTES_PROCESSED.inc(len(data), endpoint=metrics.current_endpoint())
+    return {
+        "ok": True,
+        "partial": part,
+        "minutes": [[m, label, service, n] for (m, label, service), n in minutes.items()],
+        "lines": seen["lines"],   # physical lines (sample lineno base for the next chunk)
+        "chars": len(text),       # decoded length (sample offset base for the next chunk)
+        "matched": seen["matched"],  # records matched by a rule (job progress)
+        "ruleset": ruleset.version,
+        "model_version": current_version(),
+        "seconds": round(time.perf_counter() - t0, 4),
+    }
+
+
+class _WorkerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep the coordinator's connection open between chunks
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._send(200, _dumps({"ok": True, "pid": os.getpid(), "model_version": current_version()}))
+        elif path == "/metrics":
+            self._send(200, metrics.render().encode(), "text/plain; version=0.0.4")
+        else:
+            self._send(404, _dumps({"ok": False, "error": "not found"}))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        data = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if url.path != "/chunk":
+            return self._send(404, _dumps({"ok": False, "error": "not found"}))
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        token = metrics.set_endpoint("/chunk")
+        t0 = time.perf_counter()
+        status = 200
+        try:
+            body = _dumps(analyze_chunk(data, q.get("format", "default"), q.get("tenant") or None,
+                                        int(q.get("max_samples", SAMPLES_SHOWN))))
+        except (RuleSetError, ValueError) as e:
+            status, body = 400, _dumps({"ok": False, "error": str(e)})
+        except Exception as e:
+            log.exception("chunk failed")
+            status, body = 500, _dumps({"ok": False, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            metrics.reset_endpoint(token)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - t0, method="POST", endpoint="/chunk", status=status)
+        self._send(status, body)
+
+    def log_message(self, format, *args):
+        log.debug("%s " + format, self.address_string(), *args)
+
+
+def serve(host: str = "127.0.0.1", port: int = 9101):
+    """Run a worker until interrupted; prints its URL once it is ready for chunks."""
+    from .analysis import MODEL
+    from .ml_online import current_model
+    rulesets.get()                  # compile the base rules and load the model up front,
+    current_model(fallback=MODEL)   # so the first chunk does not pay for it
+    server = ThreadingHTTPServer((host, port), _WorkerHandler)
+    print(f"http://{host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@contextmanager
+def local_workers(n: int, host: str = "127.0.0.1") -> Iterator[List[str]]:
+    """Start n worker processes on free ports; yields their URLs and stops them on exit."""
+    procs = [subprocess.Popen([sys.executable, "-m", "backend.coordinator", "worker", "--host", host, "--port", "0"],
+                              cwd=REPO_DIR, stdout=subprocess.PIPE, text=True) for _ in range(n)]
+    try:
+        urls = []
+        for p in procs:
+            for line in p.stdout:
+                if line.startswith("http://"):
+                    urls.append(line.strip())
+                    break
+            else:
+                raise CoordinatorError(f"worker {p.pid} exited before listening (status {p.wait()})")
+        yield urls
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+# ---------------------------
+# Coordinator
+# ---------------------------
+def split_chunks(buf, fmt: LogFormat, chunk_bytes: int = CHUNK_BYTES) -> List[Tuple[int, int]]:
+    """
+    (start, end) byte ranges of about chunk_bytes, cut after a newline where the next line
+    starts a record; for multi-line formats continuation lines stay with their record.
+    """
+    bounds: List[Tuple[int, int]] = []
+    start, n = 0, len(buf)
+    while start < n:
+        pos, end = start + max(chunk_bytes, 1), n
+        while pos < n:
+            nl = buf.find(b"\n", pos - 1)
+            if nl == -1 or nl + 1 >= n:
+                break
+            end = nl + 1
+            if not fmt.multiline:
+                break
+            line_end = buf.find(b"\n", end)
+            line = buf[end:n if line_end == -1 else line_end].decode(errors="ignore").rstrip("\r")
+            if fmt.parse_line(line, {}) is not None:
+                break
+            pos, end = end + 1, n
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def _join(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    # incident service/code are ", "-joined sets (detector.aggregate_incidents)
+    vals = [v for s in (a, b) if s for v in s.split(", ")]
+    return ", ".join(dict.fromkeys(vals)) if vals else None
+
+
+def merge(results: List[Dict[str, Any]], max_samples: int = SAMPLES_SHOWN) -> Tuple[Dict[str, Any], Counter]:
+    """
+    Chunk results (input order) -> (partial of the whole input, minutes for history.record).
+    Sample lineno/offset are rebased onto the whole input.
+    """
+    totals: Counter = Counter()
+    timeline: Counter = Counter()
+    minutes: Counter = Counter()
+    by_rule: Dict[str, Dict[str, Any]] = {}
+    by_model: Dict[str, Dict[str, Any]] = {}
+    line_base = char_base = 0
+    for r in results:
+        part = r["partial"]
+        totals.update(part["totals"])
+        timeline.update(part["timeline"])
+        for m, label, service, n in r["minutes"]:
+            minutes[(m, label, service)] += n
+        for inc in part["incidents"]:
+            for ln in inc["samples"]:
+                if ln.get("lineno") is not None:
+                    ln["lineno"] += line_base
+                    ln["offset"] += char_base
+            is_rule = "rule_id" in (inc.get("why") or {})
+            into = by_rule if is_rule else by_model
+            cur = into.get(inc["label"])
+            if cur is None:
+                into[inc["label"]] = inc
+                continue
+            cur["count"] += inc["count"]
+            cur["samples"].extend(inc["samples"][:max(0, max_samples - len(cur["samples"]))])
+            if is_rule:
+                cur["end"] = inc["end"]
+                cur["why"]["matches"] += inc["why"]["matches"]
+                cur["service"] = _join(cur["service"], inc["service"])
+                cur["code"] = _join(cur["code"], inc["code"])
+        line_base += r["lines"]
+        char_base += r["chars"]
+
+    incidents = sorted(by_rule.values(), key=lambda x: (x["severity"] != "High", -x["count"]))
+    incidents.extend(by_model.values())
+    part = {
+        "incidents": incidents,
+        "totals": dict(totals) or {"TOTAL": 0},
+        "timeline": dict(sorted(timeline.items())),
+        "format": results[0]["partial"]["format"] if results else None,
+    }
+    return part, minutes
+
+
+def _connection(url: str, timeout: float) -> http.client.HTTPConnection:
+    u = urlsplit(url)
+    cls = http.client.HTTPSConnection if u.scheme == "https" else http.client.HTTPConnection
+    return cls(u.hostname, u.port, timeout=timeout)
+
+
+def _counts() -> Dict[str, int]:
+    # progress totals over finished chunks, named like the job progress columns (jobs.py)
+    return {"bytes_parsed": 0, "lines_parsed": 0, "lines_matched": 0}
+
+
+def _tally(counts: Dict[str, int], result: Dict[str, Any], nbytes: int) -> Dict[str, int]:
+    """Add a finished chunk to counts; returns a snapshot for the progress callback."""
+    counts["bytes_parsed"] += nbytes
+    counts["lines_parsed"] += result["partial"]["totals"].get("TOTAL", 0)
+    counts["lines_matched"] += result.get("matched", 0)
+    return dict(counts)
+
+
+def _rejection(body: bytes, status: int) -> str:
+    # a worker answers 4xx with {"error": ...}; a proxy or wrong port may answer with an HTML page
+    try:
+        return str(_loads(body).get("error", status))
+    except (ValueError, AttributeError):
+        return f"HTTP {status}: {body[:200].decode(errors='replace')!r}"
+
+
+def dispatch(buf, bounds: List[Tuple[int, int]], workers: List[str], query: Dict[str, Any],
+             retries: int = RETRIES, timeout: float = TIMEOUT,
+             progress: Optional[Callable[[int, int, Dict[str, int]], None]] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Send every chunk to a worker, one chunk in flight per worker. A chunk that fails (connection
+    error, timeout, 5xx, unreadable 200 body) is queued again; 4xx answers (bad tenant/format,
+    or not a worker at all) fail the run at once, as does any unexpected error in a sender.
+    progress(chunks_done, chunks_total, counts) with counts as in _counts(). Returns (results in
+    input order, retries).
+    """
+    if not workers:
+        raise CoordinatorError("no workers")
+    path = "/chunk?" + urlencode({k: v for k, v in query.items() if v is not None})
+    results: List[Optional[Dict[str, Any]]] = [None] * len(bounds)
+    pending = deque((i, 0) for i in range(len(bounds)))  # (chunk index, failed attempts)
+    cond = threading.Condition()
+    state = {"outstanding": len(bounds), "alive": len(workers), "error": None, "retries": 0}
+    counts = _counts()
+
+    def take() -> Optional[Tuple[int, int]]:
+        with cond:
+            while not pending and state["outstanding"] and state["error"] is None:
+                cond.wait()
+            if state["error"] is not None or not state["outstanding"]:
+                return None
+            return pending.popleft()
+
+    def fail(err: str):
+        with cond:
+            if state["error"] is None:
+                state["error"] = err
+            cond.notify_all()
+
+    def run(url: str):
+        conn = _connection(url, timeout)
+        failures = 0
+        try:
+            while True:
+                item = take()
+                if item is None:
+                    return
+                i, attempts = item
+                start, end = bounds[i]
+                try:
+                    conn.request("POST", path, body=buf[start:end],
+                                 headers={"Content-Type": "application/octet-stream"})
+                    resp = conn.getresponse()
+                    body = resp.read()
+                    status = resp.status
+                except (OSError, http.client.HTTPException) as e:
+                    conn.close()  # reconnects on the next request
+                    status, body = None, f"{type(e).__name__}: {e}"
+                if status == 200:
+                    try:
+                        result = _loads(body)
+                    except ValueError as e:
+                        status, body = None, f"unreadable result: {e}"
+                if status == 200:
+                    failures = 0
+                    with cond:
+                        results[i] = result
+                        state["outstanding"] -= 1
+                        done, snapshot = len(bounds) - state["outstanding"], _tally(counts, result, end - start)
+                        cond.notify_all()
+                    if progress is not None:
+                        progress(done, len(bounds), snapshot)
+                    continue
+                if status is not None and 400 <= status < 500:
+                    return fail(f"chunk {i} rejected by {url}: {_rejection(body, status)}")
+                failures += 1
+                log.warning("chunk %d failed on %s (attempt %d): %s", i, url, attempts + 1,
+                            body if status is None else f"HTTP {status}")
+                with cond:
+                    if attempts + 1 > retries:
+                        state["error"] = f"chunk {i} failed {attempts + 1} times; last on {url}"
+                    else:
+                        state["retries"] += 1
+                        pending.append((i, attempts + 1))
+                    cond.notify_all()
+                if failures >= WORKER_MAX_FAILURES:
+                    log.warning("dropping worker %s after %d consecutive failures", url, failures)
+                    return
+                time.sleep(RETRY_BACKOFF * failures)
+        except Exception as e:  # never leave a taken chunk unaccounted for (the others would wait forever)
+            log.exception("coordinator sender for %s crashed", url)
+            fail(f"sender for {url} crashed: {type(e).__name__}: {e}")
+        finally:
+            conn.close()
+            with cond:
+                state["alive"] -= 1
+                if state["alive"] == 0 and state["outstanding"] and state["error"] is None:
+                    state["error"] = "no healthy workers left"
+                cond.notify_all()
+
+    threads = [threading.Thread(target=run, args=(url,), name=f"coordinator-{k}", daemon=True)
+               for k, url in enumerate(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if state["error"] is not None:
+        raise CoordinatorError(state["error"])
+    return results, state["retries"]  # type: ignore[return-value]
+
+
+def analyze_buffer(buf, workers: List[str], tenant: Optional[str] = None, chunk_bytes: int = CHUNK_BYTES,
+                   max_samples: int = SAMPLES_SHOWN, retries: int = RETRIES, timeout: float = TIMEOUT,
+                   progress: Optional[Callable[[int, int, Dict[str, int]], None]] = None) -> Tuple[Dict[str, Any], Counter]:
+    """
+    Analyse bytes (or an mmap) on the workers; returns (/analyze payload, minutes for history).
+    With no workers the chunks run one after another in this process, so memory stays at about
+    one chunk's records whatever the input size.
+    """
+    t0 = time.perf_counter()
+    fmt = detect_format(buf[:SNIFF_CHARS * 4].decode(errors="ignore"))
+    bounds = split_chunks(buf, fmt, chunk_bytes)
+    if workers:
+        query = {"format": fmt.name, "tenant": tenant, "max_samples": max_samples}
+        results, n_retries = dispatch(buf, bounds, workers, query, retries, timeout, progress)
+    else:
+        results, n_retries, counts = [], 0, _counts()
+        for k, (start, end) in enumerate(bounds):
+            results.append(analyze_chunk(buf[start:end], fmt.name, tenant, max_samples))
+            snapshot = _tally(counts, results[-1], end - start)
+            if progress is not None:
+                progress(k + 1, len(bounds), snapshot)
+
+    versions = {r["ruleset"] for r in results}
+    if len(versions) > 1:
+        raise CoordinatorError(f"workers used different rule set versions: {sorted(versions)}")
+    part, minutes = merge(results, max_samples)
+    part["format"] = fmt.name
+    payload = finish_analysis(part)
+    models = {r["model_version"] for r in results}
+    payload["ruleset"] = {"name": tenant or rulesets.BASE, "version": versions.pop() if versions else None}
+    payload["coordinator"] = {
+        "workers": len(workers),
+        "chunks": len(bounds),
+        "retries": n_retries,
+        "lines_matched": sum(r.get("matched", 0) for r in results),
+        "model_versions": sorted(models, key=str),
+        "worker_seconds": round(sum(r["seconds"] for r in results), 3),
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+    return payload, minutes
+
+
+def analyze_file(path: str, workers: List[str], record: bool = True, **kwargs) -> Tuple[Dict[str, Any], Counter]:
+    """analyze_buffer() over a memory-mapped file; records the result in the incident history."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            buf = b""
+        else:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            payload, minutes = analyze_buffer(buf, workers, **kwargs)
+            if record:
+                models = payload["coordinator"]["model_versions"]
+                record_history(hashlib.sha256(buf).hexdigest(), payload, minutes,
+                               models[0] if len(models) == 1 else None)
+        finally:
+            if isinstance(buf, mmap.mmap):
+                buf.close()
+    return payload, minutes
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+def main():
+    from .generate_stress_log import parse_size
+
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    w = sub.add_parser("worker", help="serve chunks over HTTP")
+    w.add_argument("--host", default="127.0.0.1")
+    w.add_argument("--port", type=int, default=9101, help="0 picks a free port")
+    r = sub.add_parser("run", help="analyse a file on workers")
+    r.add_argument("input")
+    r.add_argument("--workers", help="comma-separated worker URLs (default: SMARTSUPPORT_WORKERS)")
+    r.add_argument("--spawn", type=int, default=0, help="start this many local workers instead")
+    r.add_argument("--tenant", help="rule set (see GET /rulesets)")
+    r.add_argument("--chunk-size", default=str(CHUNK_BYTES), help="target chunk size, e.g. 8M")
+    r.add_argument("--max-samples", type=int, default=SAMPLES_SHOWN)
+    r.add_argument("--retries", type=int, default=RETRIES)
+    r.add_argument("--no-history", action="store_true", help="do not record in the incident history")
+    r.add_argument("--out", help="write the analysis JSON here")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.cmd == "worker":
+        return serve(args.host, args.port)
+
+    def report(done: int, total: int, counts: Dict[str, int]):
+        print(f"\r  {done}/{total} chunks  {counts['bytes_parsed'] / (1 << 20):,.1f}MB  "
+              f"{counts['lines_parsed']:,} records  {counts['lines_matched']:,} matched",
+              end="", file=sys.stderr, flush=True)
+
+    def run(urls: List[str]):
+        payload, _ = analyze_file(args.input, urls, record=not args.no_history, tenant=args.tenant,
+                                  chunk_bytes=parse_size(args.chunk_size), max_samples=args.max_samples,
+                                  retries=args.retries, progress=report)
+        print(file=sys.stderr)
+        return payload
+
+    try:
+        if args.spawn:
+            with local_workers(args.spawn) as urls:
+                payload = run(urls)
+        else:
+            urls = [u.strip() for u in (args.workers or "").split(",") if u.strip()] or WORKERS
+            payload = run(urls)
+    except CoordinatorError as e:
+        sys.exit(f"error: {e}")
+
+    c = payload["coordinator"]
+    size = os.path.getsize(args.input)
+    print(f"{payload['totals'].get('TOTAL', 0):,} records, {len(payload['incidents'])} incidents; "
+          f"{c['chunks']} chunks on {c['workers']} workers in {c['seconds']}s "
+          f"({size / c['seconds'] / (1 << 20):.1f}MB/s, {c['retries']} retries)")
+    if args.out:
+        with open(args.out, "wb") as f:
+            f.write(_dumps(payload))
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
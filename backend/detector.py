@@ -1,56 +1,240 @@
+import logging
+import os
 import re
+import threading
+import time
 import yaml
 from collections import defaultdict
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from .schemas import LogLine
 
+log = logging.getLogger(__name__)
+
+# Budgets. Python's re cannot be interrupted mid-match, so cost is bounded in two ways:
+# - each message is cut to max_len chars before matching (bounds one search)
+# - a rule whose time in one apply_rules() call exceeds budget_ms is skipped for the rest
+#   of that call and reported as tripped (bounds one rule across a whole upload)
+MAX_MESSAGE_CHARS = int(os.environ.get("SMARTSUPPORT_RULE_MAX_CHARS", 4096))
+RULE_BUDGET_MS = float(os.environ.get("SMARTSUPPORT_RULE_BUDGET_MS", 5000))
+SLOW_MATCH_MS = 10.0      # single searches slower than this are counted as slow
+# Timing every (line, rule) search costs ~30% of apply_rules, so rules are timed one by one on
+# every TIME_EVERY-th line (scaled up for total_ms / budgets) and lines as a whole otherwise;
+# a line slower than SLOW_MATCH_MS overall is re-timed rule by rule, so slow searches are
+# counted exactly. evals/hits/truncated are exact; total_ms/avg_us are estimates.
+TIME_EVERY = int(os.environ.get("SMARTSUPPORT_RULE_TIME_EVERY", 16))
+
+# load-time lint
+_GROUP_BODY = r"(?:[^()\\]|\\.|\((?:[^()\\]|\\.)*\))*"   # group contents, one level of nesting
+_NESTED_QUANT = re.compile(r"\(" + _GROUP_BODY + r"[+*}]" + _GROUP_BODY + r"\)[+*{]")   # (x+)+  (\w+\s?)+  (.*){2,}
+_QUANT_ALT = re.compile(r"\(" + _GROUP_BODY + r"\|" + _GROUP_BODY + r"\)[+*{]")        # (a|aa)+
+_DOTSTAR = re.compile(r"(?<!\\)\.[*+]")
+_WORD = re.compile(r"[A-Za-z]{3,}")
+_FLAGS = re.compile(r"^\(\?[aiLmsux]+\)")
+# the probe doubles the input each step and stops at the first step over budget, so a
+# superlinear pattern costs at most a few steps' worth of time instead of hanging the load
+PROBE_SIZES = (25, 50, 100, 200, 400, 800, 1600)
+PROBE_RATIO = 3.0         # linear growth is ~2x per doubling, quadratic ~4x
+PROBE_MIN_MS = 2.0        # ratios below this are timer noise
+PROBE_BUDGET_MS = 50.0    # one probe step slower than this flags the pattern outright
+
+class RuleStats:
+    __slots__ = ("evals", "hits", "ns", "max_ns", "slow", "truncated", "tripped")
+
+    def __init__(self):
+        self.evals = self.hits = self.ns = self.max_ns = self.slow = self.truncated = self.tripped = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "evals": self.evals,
+            "hits": self.hits,
+            "total_ms": round(self.ns / 1e6, 3),
+            "avg_us": round(self.ns / self.evals / 1e3, 3) if self.evals else 0.0,
+            "max_ms": round(self.max_ns / 1e6, 3),
+            "slow": self.slow,
+            "truncated": self.truncated,
+            "tripped": self.tripped,
+        }
+
 
 class Rule:
-    def __init__(self, id, pattern, label, severity, root_cause, recommend):
+    def __init__(self, id, pattern, label, severity, root_cause, recommend,
+                 max_len: Optional[int] = None, budget_ms: Optional[float] = None):
         self.id = id
         self.pattern = re.compile(pattern)
         self.label = label
         self.severity = severity
         self.root_cause = root_cause
         self.recommend = recommend
+        self.max_len = max_len or MAX_MESSAGE_CHARS
+        self.budget_ns = int((budget_ms or RULE_BUDGET_MS) * 1e6)
+        self.stats = RuleStats()
+        self.lint: List[Dict[str, str]] = []
 
     def hit(self, line: Dict[str, Any]):
         msg = line.get("message", "") or ""
-        m = self.pattern.search(msg)
+        m = self.pattern.search(msg, 0, self.max_len)
         return m
 
 
+def lint_pattern(rx: "re.Pattern") -> List[Dict[str, str]]:
+    """Static + empirical checks for patterns prone to catastrophic backtracking."""
+    src = rx.pattern
+    issues = []
+    if _NESTED_QUANT.search(src):
+        issues.append({"check": "nested_quantifier",
+                       "detail": "nested quantifier (e.g. (x+)+) can backtrack exponentially"})
+    if _QUANT_ALT.search(src):
+        issues.append({"check": "quantified_alternation",
+                       "detail": "repeated alternation (e.g. (a|aa)+) can backtrack exponentially"})
+    if issues:
+        return issues  # probing a pattern already known to be exponential could run forever
+    if _DOTSTAR.search(src) and not _FLAGS.sub("", src).startswith("^"):
+        issues.append({"check": "unanchored_dotstar",
+                       "detail": "unanchored .* is retried from every start position (quadratic on long lines)"})
+
+    # probe: repeat the pattern's first literal word so the prefix matches everywhere but the
+    # whole pattern does not; superlinear growth shows up as a large time ratio per doubling
+    words = _WORD.findall(_FLAGS.sub("", src))
+    seeds = ([words[0] + " "] if words else []) + ["a", "0 "]
+    for seed in seeds:
+        prev = None
+        for n in PROBE_SIZES:
+            text = (seed * (n // len(seed) + 1))[:n]
+            best = float("inf")
+            for _ in range(2):
+                t0 = time.perf_counter()
+                rx.search(text)
+                best = min(best, time.perf_counter() - t0)
+                if best * 1e3 > PROBE_BUDGET_MS:
+                    break
+            ms = best * 1e3
+            ratio = best / max(prev, 1e-9) if prev is not None else 1.0
+            if ms > PROBE_BUDGET_MS or (ms > PROBE_MIN_MS and ratio > PROBE_RATIO):
+                issues.append({"check": "superlinear", "detail": (
+                    f"probe {seed.strip()!r}: {ms:.1f}ms at {n} chars ({ratio:.1f}x for 2x input)"
+                )})
+                return issues
+            prev = best
+    return issues
+
 def load_rules(path: str) -> List[Rule]:
-    items = yaml.safe_load(open(path))
-    return [Rule(i['id'], i['pattern'], i['label'], i['severity'],
-                 i['root_cause'], i['recommend']) for i in items]
+    return build_rules(yaml.safe_load(open(path)))
+
+
+def build_rules(items: List[Dict[str, Any]]) -> List[Rule]:
+    """Compile and lint rule definitions (dicts shaped like rules.yaml entries)."""
+    rules = [Rule(i['id'], i['pattern'], i['label'], i['severity'],
+                  i['root_cause'], i['recommend'], i.get('max_len'), i.get('budget_ms')) for i in items]
+    for r in rules:
+        r.lint = lint_pattern(r.pattern)
+        for issue in r.lint:
+            if issue["check"] != "unanchored_dotstar":  # informational; the probe confirms it
+                log.warning("rule %s: %s (%s)", r.id, issue["check"], issue["detail"])
+    return rules
+
+
+_stats_lock = threading.Lock()
+
+
+def _match(r: Rule, m) -> Dict[str, Any]:
+    return {
+        "rule_id": r.id,
+        "label": r.label,
+        "severity": r.severity,
+        "root_cause": r.root_cause,
+        "recommend": r.recommend,
+        "spans": [m.span()],
+    }
 
 
 def apply_rules(lines: List[Dict[str, Any]], rules: List[Rule]):
     hits = []
-    for ln in lines:
+    clock = time.perf_counter_ns
+    slow_ns = int(SLOW_MATCH_MS * 1e6)
+    every = max(TIME_EVERY, 1)
+    n = len(rules)
+    shortest = min((r.max_len for r in rules), default=0)
+    # per-call accumulators, merged into Rule.stats once at the end
+    evals, nhits, spent, worst, slow, trunc = [len(lines)] * n, [0] * n, [0] * n, [0] * n, [0] * n, [0] * n
+    active = list(range(n))
+    tripped = set()
+
+    def timed(msg: str, scale: int, matched: Optional[List[Dict[str, Any]]]):
+        # searches slower than slow_ns are counted as measured, faster ones scaled by the sampling
+        # rate; scale=0, matched=None re-times an already matched slow line to find its slow rules
+        for i in active:
+            r = rules[i]
+            t0 = clock()
+            m = r.pattern.search(msg, 0, r.max_len)
+            dt = clock() - t0
+            spent[i] += dt if dt > slow_ns else dt * scale
+            if dt > worst[i]:
+                worst[i] = dt
+            if dt > slow_ns:
+                slow[i] += 1
+            if m and matched is not None:
+                nhits[i] += 1
+                matched.append(_match(r, m))
+            if spent[i] > r.budget_ns:
+                tripped.add(i)
+
+    for k, ln in enumerate(lines):
+        msg = ln.get("message", "") or ""
+        if len(msg) > shortest:
+            for i in active:
+                if len(msg) > rules[i].max_len:
+                    trunc[i] += 1
         matched = []
-        for r in rules:
-            m = r.hit(ln)
-            if m:
-                matched.append({
-                    "rule_id": r.id,
-                    "label": r.label,
-                    "severity": r.severity,
-                    "root_cause": r.root_cause,
-                    "recommend": r.recommend,
-                    "spans": [m.span()],
-                })
+        if k % every == 0:
+            timed(msg, every, matched)
+        else:
+            t0 = clock()
+            for i in active:
+                r = rules[i]
+                m = r.pattern.search(msg, 0, r.max_len)
+                if m:
+                    nhits[i] += 1
+                    matched.append(_match(r, m))
+            if clock() - t0 > slow_ns:
+                timed(msg, 0, None)
+        if len(active) + len(tripped) > n:
+            for i in active:
+                if i in tripped:
+                    evals[i] = k + 1
+            active = [i for i in active if i not in tripped]
         if matched:
             hits.append((ln, matched))
+
+    with _stats_lock:
+        for i, r in enumerate(rules):
+            s = r.stats
+            s.evals += evals[i]
+            s.hits += nhits[i]
+            s.ns += spent[i]
+            s.max_ns = max(s.max_ns, worst[i])
+            s.slow += slow[i]
+            s.truncated += trunc[i]
+            if i in tripped:
+                s.tripped += 1
+                log.warning("rule %s exceeded its %.0fms budget; skipped for the rest of the input",
+                            r.id, r.budget_ns / 1e6)
     return hits
 
 
+def rule_profile(rules: List[Rule]) -> List[Dict[str, Any]]:
+    """Per-rule cost, most expensive first."""
+    rows = [{"id": r.id, "label": r.label, **r.stats.to_dict(), "lint": r.lint} for r in rules]
+    total = sum(r["total_ms"] for r in rows) or 1.0
+    for row in rows:
+        row["share"] = round(row["total_ms"] / total, 4)
+    return sorted(rows, key=lambda x: -x["total_ms"])
+
+
 from collections import defaultdict
 from typing import List, Dict, Any
 
-def aggregate_incidents(rule_hits: List):
+def aggregate_incidents(rule_hits: List, max_samples: int = 5):
     buckets = defaultdict(list)
     for ln, matched in rule_hits:
         m = matched[0]
@@ -80,11 +264,11 @@ def aggregate_incidents(rule_hits: List):
             "count": len(lines),
             "start": start,
             "end": end,
-            "samples": lines[:5],
+            "samples": lines[:max_samples],
             "why": {"rule_id": vals[0][1]['rule_id'], "matches": len(vals)},
             "root_cause": rc,
             "recommend": rec
         })
 
     incidents.sort(key=lambda x: (x['severity'] != 'High', -x['count']))
-    return incidents
\ No newline at end of file
+    return incidents
@@ -0,0 +1,253 @@
+# backend/feedback_store.py
+"""
+Feedback event store.
+- Write path: append() queues events; a background thread writes them to feedback.jsonl in
+  batches under an exclusive file lock, so several uvicorn workers can share one log.
+- Identical events (same content, ignoring ts) are dropped within DEDUPE_WINDOW in-process,
+  and collapsed into one row (with a repeat count) when compacted.
+- Read path: compact() folds new log lines (from the last byte offset) into SQLite, indexed by
+  cluster id, label and time; query() answers from there.
+"""
+
+from typing import Any, Dict, List, Optional
+import atexit, hashlib, json, os, queue, sqlite3, threading, time
+
+try:
+    import fcntl  # POSIX only; elsewhere we rely on O_APPEND alone
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+BASE_DIR = os.path.dirname(__file__)
+FEEDBACK_DB = os.path.join(BASE_DIR, "data", "feedback.sqlite")
+
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 0.5   # seconds the writer waits to fill a batch
+DEDUPE_WINDOW = 30.0   # seconds an identical event is suppressed in-process
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    key        TEXT PRIMARY KEY,
+    type       TEXT,
+    cluster_id TEXT,
+    label      TEXT,
+    verdict    TEXT,
+    first_ts   REAL,
+    last_ts    REAL,
+    n          INTEGER NOT NULL DEFAULT 1,
+    item       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS feedback_cluster ON feedback (cluster_id, last_ts);
+CREATE INDEX IF NOT EXISTS feedback_label ON feedback (label, last_ts);
+CREATE INDEX IF NOT EXISTS feedback_ts ON feedback (last_ts);
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def event_key(item: Dict[str, Any]) -> str:
+    """Content hash of an event, ignoring its timestamp."""
+    body = {k: v for k, v in item.items() if k != "ts"}
+    return hashlib.sha1(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class FeedbackStore:
+    def __init__(self, log_path: str, db_path: str = FEEDBACK_DB):
+        self.log_path = log_path
+        self.db_path = db_path
+        self._q: "queue.Queue[Any]" = queue.Queue()
+        self._recent: Dict[str, float] = {}
+        self._recent_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.close)
+
+    # ---------------------------
+    # Write path
+    # ---------------------------
+    def append(self, item: Dict[str, Any]) -> bool:
+        """Queue an event; returns False if it duplicates one seen within DEDUPE_WINDOW."""
+        item.setdefault("ts", time.time())
+        key = event_key(item)
+        now = time.time()
+        with self._recent_lock:
+            seen = self._recent.get(key)
+            if seen is not None and now - seen < DEDUPE_WINDOW:
+                return False
+            self._recent[key] = now
+            if len(self._recent) > 10000:
+                self._recent = {k: t for k, t in self._recent.items() if now - t < DEDUPE_WINDOW}
+        self._ensure_writer()
+        self._q.put(json.dumps(item))
+        return True
+
+    def _ensure_writer(self):
+        with self._start_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        # queue items: str = log line, Event = flush barrier, None = stop
+        while True:
+            item = self._q.get()
+            batch: List[str] = []
+            deadline = time.time() + FLUSH_INTERVAL
+            while isinstance(item, str):
+                batch.append(item)
+                if len(batch) >= BATCH_SIZE:
+                    break
+                try:
+                    item = self._q.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    item = ""
+                    break
+            if batch:
+                self._write(batch)
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                return
+
+    def _write(self, batch: List[str]):
+        data = ("\n".join(batch) + "\n").encode()
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, data)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def flush(self, timeout: float = 5.0):
+        """Block until everything queued so far is on disk."""
+        writer = self._writer
+        if writer is not None and writer.is_alive():
+            done = threading.Event()
+            self._q.put(done)
+            done.wait(timeout)
+            return
+        batch = []
+        while True:
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, str):
+                batch.append(item)
+        if batch:
+            self._write(batch)
+
+    def close(self):
+        with self._start_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None and writer.is_alive():
+            self._q.put(None)
+            writer.join(timeout=5)
+        self.flush()
+
+    # ---------------------------
+    # Read path
+    # ---------------------------
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def compact(self) -> Dict[str, int]:
+        """Fold log lines appended since the last compaction into the SQLite index."""
+        self.flush()
+        with self._compact_lock:
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                row = conn.execute("SELECT value FROM meta WHERE name = 'offset'").fetchone()
+                offset = int(row["value"]) if row else 0
+                if not os.path.exists(self.log_path):
+                    conn.execute("COMMIT")
+                    return {"read": 0, "new": 0, "duplicates": 0}
+                if os.path.getsize(self.log_path) < offset:
+                    offset = 0  # log was rotated/truncated; re-read it from the start
+
+                read = new = 0
+                with open(self.log_path, "rb") as f:
+                    f.seek(offset)
+                    for raw in f:
+                        if not raw.endswith(b"\n"):
+                            break  # partial line still being written
+                        offset += len(raw)
+                        try:
+                            item = json.loads(raw)
+                        except ValueError:
+                            continue
+                        read += 1
+                        new += self._upsert(conn, item)
+                conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('offset', ?)", (str(offset),))
+                conn.execute("COMMIT")
+                return {"read": read, "new": new, "duplicates": read - new}
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+    @staticmethod
+    def _upsert(conn: sqlite3.Connection, item: Dict[str, Any]) -> int:
+        ts = float(item.get("ts") or 0)
+        key = event_key(item)
+        cur = conn.execute(
+            "UPDATE feedback SET n = n + 1, first_ts = MIN(first_ts, ?), last_ts = MAX(last_ts, ?) WHERE key = ?",
+            (ts, ts, key),
+        )
+        if cur.rowcount:
+            return 0
+        cid = item.get("cluster_id")
+        conn.execute(
+            "INSERT INTO feedback (key, type, cluster_id, label, verdict, first_ts, last_ts, item) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, item.get("type"), None if cid is None else str(cid), item.get("label"),
+             item.get("verdict"), ts, ts, json.dumps(item)),
+        )
+        return 1
+
+    def query(
+        self,
+        cluster_id: Optional[str] = None,
+        label: Optional[str] = None,
+        type: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Deduplicated events, newest first; each carries its repeat count as 'n'."""
+        self.compact()
+        where, args = [], []
+        for col, val in (("cluster_id", cluster_id), ("label", label), ("type", type)):
+            if val is not None:
+                where.append(f"{col} = ?")
+                args.append(str(val))
+        if since is not None:
+            where.append("last_ts >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("first_ts < ?")
+            args.append(until)
+        sql = "SELECT item, n, first_ts, last_ts FROM feedback"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY last_ts DESC LIMIT ?"
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, (*args, limit)).fetchall()
+        finally:
+            conn.close()
+        out = []
+        for r in rows:
+            item = json.loads(r["item"])
+            item.update({"n": r["n"], "first_ts": r["first_ts"], "last_ts": r["last_ts"]})
+            out.append(item)
+        return out
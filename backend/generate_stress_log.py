@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
+"""
+python backend/generate_stress_log.py                     # the fixed 1000-line stress_1000.log
+python backend/generate_stress_log.py --size 2G -o big.log [--services 40 --stack-ratio 0.2 ...]
+Large outputs are streamed to disk by synth.stream_log.
+"""
+import argparse
 import random
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 OUT = Path(__file__).parent / "stress_1000.log"
-random.seed(42)
 
 start = datetime(2025, 10, 15, 12, 0, 0, tzinfo=timezone.utc)
 
@@ -63,69 +68,111 @@ WARNS = [
 def fmt(ts, level, svc, host, msg):
     return f"{ts.strftime('%Y-%m-%dT%H:%M:%SZ')} [{level}] {svc} {host} - {msg}"
 
-lines = []
-current = start
-
-# Strategy:
-# - Generate 1,000 lines over ~2 hours
-# - Every 5 minutes: produce a "burst" minute with 12–20 ERROR lines
-# - Other minutes: a mix of INFO/WARN/occasional ERROR
-
-minute = 0
-while len(lines) < 1000:
-    minute_ts = start + timedelta(minutes=minute)
-    burst = (minute % 5 == 0)  # every 5 minutes
-
-    if burst:
-        # Burst: 12–20 ERRORs within the same minute, mixed known/unknown
-        n_err = random.randint(12, 20)
-        for i in range(n_err):
-            ts = minute_ts + timedelta(seconds=random.randint(0, 59))
-            if random.random() < 0.75:
-                svc, msg = random.choice(KNOWN_ERRORS)
-            else:
-                svc, msg = random.choice(UNKNOWN_ERRORS)
-            host = random.choice([h for s, h in services if s == svc] + ["srv-zz"])
-            lines.append(fmt(ts, "ERROR", svc, host, msg))
-        # plus a couple of WARN/INFO for flavor
-        for _ in range(random.randint(2, 5)):
-            svc, host = random.choice(services)
-            ts = minute_ts + timedelta(seconds=random.randint(0, 59))
-            msg = random.choice(WARNS)
-            lines.append(fmt(ts, "WARN", svc, host, msg))
-        for _ in range(random.randint(2, 4)):
-            svc, host = random.choice(services)
-            ts = minute_ts + timedelta(seconds=random.randint(0, 59))
-            msg = random.choice(INFOS)
-            lines.append(fmt(ts, "INFO", svc, host, msg))
-    else:
-        # Normal minute: 5–10 lines, mostly INFO/WARN, rare ERROR
-        n = random.randint(5, 10)
-        for _ in range(n):
-            svc, host = random.choice(services)
-            ts = minute_ts + timedelta(seconds=random.randint(0, 59))
-            r = random.random()
-            if r < 0.70:
-                msg = random.choice(INFOS)
-                level = "INFO"
-            elif r < 0.95:
-                msg = random.choice(WARNS)
-                level = "WARN"
-            else:
-                # occasional error
-                if random.random() < 0.7:
+def write_stress_1000():
+    random.seed(42)
+    lines = []
+    current = start
+
+    # Strategy:
+    # - Generate 1,000 lines over ~2 hours
+    # - Every 5 minutes: produce a "burst" minute with 12–20 ERROR lines
+    # - Other minutes: a mix of INFO/WARN/occasional ERROR
+
+    minute = 0
+    while len(lines) < 1000:
+        minute_ts = start + timedelta(minutes=minute)
+        burst = (minute % 5 == 0)  # every 5 minutes
+
+        if burst:
+            # Burst: 12–20 ERRORs within the same minute, mixed known/unknown
+            n_err = random.randint(12, 20)
+            for i in range(n_err):
+                ts = minute_ts + timedelta(seconds=random.randint(0, 59))
+                if random.random() < 0.75:
                     svc, msg = random.choice(KNOWN_ERRORS)
                 else:
                     svc, msg = random.choice(UNKNOWN_ERRORS)
-                host = random.choice([h for s, h in services if s == svc] + ["srv-yy"])
-                level = "ERROR"
-            lines.append(fmt(ts, level, svc, host, msg))
+                host = random.choice([h for s, h in services if s == svc] + ["srv-zz"])
+                lines.append(fmt(ts, "ERROR", svc, host, msg))
+            # plus a couple of WARN/INFO for flavor
+            for _ in range(random.randint(2, 5)):
+                svc, host = random.choice(services)
+                ts = minute_ts + timedelta(seconds=random.randint(0, 59))
+                msg = random.choice(WARNS)
+                lines.append(fmt(ts, "WARN", svc, host, msg))
+            for _ in range(random.randint(2, 4)):
+                svc, host = random.choice(services)
+                ts = minute_ts + timedelta(seconds=random.randint(0, 59))
+                msg = random.choice(INFOS)
+                lines.append(fmt(ts, "INFO", svc, host, msg))
+        else:
+            # Normal minute: 5–10 lines, mostly INFO/WARN, rare ERROR
+            n = random.randint(5, 10)
+            for _ in range(n):
+                svc, host = random.choice(services)
+                ts = minute_ts + timedelta(seconds=random.randint(0, 59))
+                r = random.random()
+                if r < 0.70:
+                    msg = random.choice(INFOS)
+                    level = "INFO"
+                elif r < 0.95:
+                    msg = random.choice(WARNS)
+                    level = "WARN"
+                else:
+                    # occasional error
+                    if random.random() < 0.7:
+                        svc, msg = random.choice(KNOWN_ERRORS)
+                    else:
+                        svc, msg = random.choice(UNKNOWN_ERRORS)
+                    host = random.choice([h for s, h in services if s == svc] + ["srv-yy"])
+                    level = "ERROR"
+                lines.append(fmt(ts, level, svc, host, msg))
+
+        minute += 1
+
+    # Sort globally by timestamp and trim exactly 1000 lines
+    lines.sort()
+    lines = lines[:1000]
+
+    OUT.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    print(f"Wrote {len(lines)} lines to {OUT}")
+
+
+def parse_size(text: str) -> int:
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    text = text.strip().upper().rstrip("B")
+    return int(float(text[:-1]) * units[text[-1]]) if text[-1:] in units else int(text)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", help="target size, e.g. 500M or 2G")
+    ap.add_argument("--lines", type=int, help="target line count")
+    ap.add_argument("-o", "--out", default="big.log")
+    ap.add_argument("--services", type=int, default=8)
+    ap.add_argument("--mix", default="", help="weights, e.g. info=0.6,warn=0.2,known=0.15,unknown=0.05")
+    ap.add_argument("--burst-rate", type=float, default=0.05, help="fraction of minutes with an error burst")
+    ap.add_argument("--stack-ratio", type=float, default=0.1, help="fraction of errors with a stack trace")
+    ap.add_argument("--lines-per-minute", type=int, default=600)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args()
 
-    minute += 1
+    if not args.size and not args.lines:
+        write_stress_1000()
+        return
+    try:
+        from .synth import stream_log
+    except ImportError:  # run as a plain script
+        from synth import stream_log
+    mix = {k: float(v) for k, v in (kv.split("=") for kv in args.mix.split(",") if kv)}
+    with open(args.out, "w", encoding="utf-8", buffering=1 << 20) as f:
+        stats = stream_log(
+            f, size_bytes=parse_size(args.size) if args.size else None, lines=args.lines,
+            services=args.services, mix=mix, burst_rate=args.burst_rate, stack_ratio=args.stack_ratio,
+            lines_per_minute=args.lines_per_minute, seed=args.seed,
+        )
+    print(f"Wrote {stats['lines']} lines ({stats['bytes']} bytes) to {args.out}")
 
-# Sort globally by timestamp and trim exactly 1000 lines
-lines.sort()
-lines = lines[:1000]
 
-OUT.write_text("\n".join(lines) + "\n", encoding="utf-8")
-print(f"Wrote {len(lines)} lines to {OUT}")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+# backend/history.py
+"""
+Incident history across uploads (SQLite, backend/data/history.sqlite).
+- record() stores one analysis per content fingerprint and tenant (rule set name; re-uploads
+  are ignored): the analysis, its incidents per (label, service), and per-minute counts per
+  (label, service)
+- all times are epoch seconds (INTEGER); minute/hour buckets are floored epochs
+- hour_counts (tenant, label, service, hour) and label_hours (tenant, label, hour) are rollups
+  across analyses, so trend()/top() over months read at most hours x labels (x services) rows
+  from covering indexes
+- trend()/top() report one tenant (default base): the same upload analysed for several tenants
+  is counted once per tenant, so summing tenants (tenant=None) can count it more than once
+- occurrences() lists the analyses a label appeared in ("have we seen this before?"), optionally
+  for one tenant
+"""
+
+from collections import Counter
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import os, sqlite3, time
+
+from .parser import to_epoch
+
+BASE_DIR = os.path.dirname(__file__)
+HISTORY_DB = os.path.join(BASE_DIR, "data", "history.sqlite")
+HISTORY_ENABLED = os.environ.get("SMARTSUPPORT_HISTORY", "1") != "0"
+
+BUCKETS = {"minute": 60, "hour": 3600, "day": 86400, "week": 7 * 86400}
+
+# tables whose rows belong to one tenant; {name} lets a migration build a copy under a new name
+_TENANT_TABLES = {
+    "analyses": """
+CREATE TABLE IF NOT EXISTS {name} (
+    id            INTEGER PRIMARY KEY,
+    fingerprint   TEXT NOT NULL,
+    tenant        TEXT NOT NULL DEFAULT 'base',
+    created       INTEGER NOT NULL,
+    start_ts      INTEGER,
+    end_ts        INTEGER,
+    lines         INTEGER,
+    errors        INTEGER,
+    model_version INTEGER,
+    UNIQUE (fingerprint, tenant)
+)""",
+    "minute_counts": """
+CREATE TABLE IF NOT EXISTS {name} (
+    analysis_id INTEGER NOT NULL,
+    tenant      TEXT NOT NULL DEFAULT 'base',
+    minute      INTEGER NOT NULL,
+    label       TEXT NOT NULL,
+    service     TEXT NOT NULL DEFAULT '',
+    n           INTEGER NOT NULL
+)""",
+    "hour_counts": """
+CREATE TABLE IF NOT EXISTS {name} (
+    tenant  TEXT NOT NULL DEFAULT 'base',
+    label   TEXT NOT NULL,
+    service TEXT NOT NULL DEFAULT '',
+    hour    INTEGER NOT NULL,
+    n       INTEGER NOT NULL,
+    PRIMARY KEY (tenant, label, service, hour)
+) WITHOUT ROWID""",
+    "label_hours": """
+CREATE TABLE IF NOT EXISTS {name} (
+    tenant TEXT NOT NULL DEFAULT 'base',
+    label  TEXT NOT NULL,
+    hour   INTEGER NOT NULL,
+    n      INTEGER NOT NULL,
+    PRIMARY KEY (tenant, label, hour)
+) WITHOUT ROWID""",
+}
+_SCHEMA = ";".join(ddl.format(name=name) for name, ddl in _TENANT_TABLES.items()) + """;
+CREATE INDEX IF NOT EXISTS analyses_created ON analyses (created);
+CREATE INDEX IF NOT EXISTS analyses_tenant ON analyses (tenant, created);
+CREATE TABLE IF NOT EXISTS incidents (
+    analysis_id INTEGER NOT NULL REFERENCES analyses (id),
+    label       TEXT NOT NULL,
+    service     TEXT NOT NULL DEFAULT '',
+    severity    TEXT,
+    count       INTEGER NOT NULL,
+    start_ts    INTEGER,
+    end_ts      INTEGER
+);
+CREATE INDEX IF NOT EXISTS incidents_label ON incidents (label, service, start_ts);
+CREATE INDEX IF NOT EXISTS incidents_label_ts ON incidents (label, start_ts);
+CREATE INDEX IF NOT EXISTS incidents_analysis ON incidents (analysis_id);
+CREATE INDEX IF NOT EXISTS minute_label ON minute_counts (tenant, label, service, minute, n);
+CREATE INDEX IF NOT EXISTS minute_ts ON minute_counts (tenant, minute, label, n);
+CREATE INDEX IF NOT EXISTS hour_ts ON hour_counts (tenant, hour, label, service, n);
+CREATE INDEX IF NOT EXISTS label_hours_ts ON label_hours (tenant, hour, label, n);
+"""
+
+
+def _connect(db_path: Optional[str] = None) -> sqlite3.Connection:
+    db_path = db_path or HISTORY_DB  # read at call time, so HISTORY_DB can be pointed elsewhere
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    _migrate_tenant(conn)
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _without_tenant(conn: sqlite3.Connection) -> Dict[str, List[str]]:
+    """Existing tables from before tenants -> their columns."""
+    out = {}
+    for name in _TENANT_TABLES:
+        cols = [r["name"] for r in conn.execute(f"PRAGMA table_info({name})")]
+        if cols and "tenant" not in cols:
+            out[name] = cols
+    return out
+
+
+def _migrate_tenant(conn: sqlite3.Connection):
+    # databases from before tenants: unique keys and primary keys gain the tenant, which SQLite
+    # cannot change in place, so each table is copied (old rows become 'base'). Indexes on the
+    # old tables go with them and are recreated by _SCHEMA.
+    if not _without_tenant(conn):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for name, cols in _without_tenant(conn).items():  # re-read: another process may have migrated
+            conn.execute(_TENANT_TABLES[name].format(name=f"{name}_new"))
+            conn.execute(f"INSERT INTO {name}_new ({', '.join(cols)}) SELECT {', '.join(cols)} FROM {name}")
+            conn.execute(f"DROP TABLE {name}")
+            conn.execute(f"ALTER TABLE {name}_new RENAME TO {name}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+@lru_cache(maxsize=65536)
+def _minute_epoch(minute: str) -> Optional[int]:
+    # 'YYYY-MM-DDTHH:MM' keys repeat for every line in that minute
+    return to_epoch(minute + ":00Z") if len(minute) == 16 else to_epoch(minute)
+
+
+def as_epoch(value: Any) -> Optional[int]:
+    """Query parameter -> epoch seconds; accepts epoch numbers or ISO strings."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    s = str(value).strip()
+    if s.lstrip("-").isdigit():
+        return int(s)
+    ep = to_epoch(s)
+    if ep is None:
+        raise ValueError(f"unparseable time: {value!r}")
+    return ep
+
+
+# ---------------------------
+# Write path
+# ---------------------------
+def record(fingerprint: str, payload: Dict[str, Any], minutes: "Counter[Tuple[str, str, str]]",
+           model_version: Optional[int] = None, tenant: str = "base", db_path: Optional[str] = None) -> bool:
+    """
+    Store an analysis. minutes maps (ts[:16], label, service) -> incident lines, as collected by
+    analysis.run_analysis(minutes=...). tenant is the rule set the analysis used.
+    Returns False if this fingerprint is already recorded for the tenant.
+    """
+    by_incident: Dict[Tuple[str, str], List[Any]] = {}  # (label, service) -> [count, first, last]
+    minute_rows = []
+    hour_rows: Counter = Counter()
+    label_rows: Counter = Counter()
+    for (minute, label, service), n in minutes.items():
+        ep = _minute_epoch(minute) if minute else None
+        agg = by_incident.setdefault((label, service), [0, None, None])
+        agg[0] += n
+        if ep is None:
+            continue
+        agg[1] = ep if agg[1] is None else min(agg[1], ep)
+        agg[2] = ep + 59 if agg[2] is None else max(agg[2], ep + 59)
+        minute_rows.append((tenant, ep, label, service, n))
+        hour_rows[(label, service, ep - ep % 3600)] += n
+        label_rows[(label, ep - ep % 3600)] += n
+
+    severity = {inc["label"]: inc.get("severity") for inc in payload.get("incidents", [])}
+    span = [ep for ep in map(_minute_epoch, payload.get("timeline", {})) if ep is not None]
+    totals = payload.get("totals", {})
+
+    conn = _connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO analyses "
+                "(fingerprint, tenant, created, start_ts, end_ts, lines, errors, model_version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint, tenant, int(time.time()), min(span, default=None),
+                 max(span) + 59 if span else None, totals.get("TOTAL"), totals.get("ERROR"), model_version),
+            )
+            if cur.rowcount == 0:
+                conn.execute("COMMIT")
+                return False
+            aid = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO incidents (analysis_id, label, service, severity, count, start_ts, end_ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(aid, label, service, severity.get(label), c, first, last)
+                 for (label, service), (c, first, last) in by_incident.items()],
+            )
+            conn.executemany(
+                "INSERT INTO minute_counts (analysis_id, tenant, minute, label, service, n) VALUES (?, ?, ?, ?, ?, ?)",
+                [(aid, *row) for row in minute_rows],
+            )
+            conn.executemany(
+                "INSERT INTO hour_counts (tenant, label, service, hour, n) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (tenant, label, service, hour) DO UPDATE SET n = n + excluded.n",
+                [(tenant, label, service, hour, n) for (label, service, hour), n in hour_rows.items()],
+            )
+            conn.executemany(
+                "INSERT INTO label_hours (tenant, label, hour, n) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (tenant, label, hour) DO UPDATE SET n = n + excluded.n",
+                [(tenant, label, hour, n) for (label, hour), n in label_rows.items()],
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+# ---------------------------
+# Read path
+# ---------------------------
+def _where(label: Optional[str], service: Optional[str], col: str, since: Optional[int],
+           until: Optional[int], prefix: str = "", tenant: Optional[str] = None) -> Tuple[str, List[Any]]:
+    clauses, args = [], []
+    if tenant is not None:
+        clauses.append(f"{prefix}tenant = ?")
+        args.append(tenant)
+    if label is not None:
+        clauses.append(f"{prefix}label = ?")
+        args.append(label)
+    if service is not None:
+        clauses.append(f"{prefix}service = ?")
+        args.append(service)
+    if since is not None:
+        clauses.append(f"{col} >= ?")
+        args.append(since)
+    if until is not None:
+        clauses.append(f"{col} < ?")
+        args.append(until)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+
+def trend(label: Optional[str] = None, service: Optional[str] = None, since: Optional[int] = None,
+          until: Optional[int] = None, bucket: str = "hour", tenant: Optional[str] = "base",
+          db_path: Optional[str] = None) -> List[Dict[str, int]]:
+    """
+    Incident lines per time bucket for a tenant (None: summed over tenants), oldest first.
+    Buckets of an hour or more read a rollup.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {list(BUCKETS)}")
+    size = BUCKETS[bucket]
+    if size < 3600:
+        table, col = "minute_counts", "minute"
+    else:
+        table, col = ("hour_counts" if service is not None else "label_hours"), "hour"
+    where, args = _where(label, service, col, since, until, tenant=tenant)
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            f"SELECT ({col} / ?) * ? AS t, SUM(n) AS n FROM {table}{where} GROUP BY t ORDER BY t",
+            [size, size, *args],
+        ).fetchall()
+        return [{"t": r["t"], "n": r["n"]} for r in rows]
+    finally:
+        conn.close()
+
+
+def top(by: str = "label", since: Optional[int] = None, until: Optional[int] = None,
+        label: Optional[str] = None, limit: int = 10, tenant: Optional[str] = "base",
+        db_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Top labels (or services, optionally within one label) by incident lines in a time range,
+    for a tenant (None: summed over tenants).
+    """
+    if by not in ("label", "service"):
+        raise ValueError("by must be 'label' or 'service'")
+    table = "label_hours" if by == "label" and label is None else "hour_counts"
+    where, args = _where(label, None, "hour", since, until, tenant=tenant)
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            f"SELECT {by} AS key, SUM(n) AS n, MIN(hour) AS first_hour, MAX(hour) AS last_hour "
+            f"FROM {table}{where} GROUP BY {by} ORDER BY n DESC LIMIT ?",
+            [*args, limit],
+        ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
+
+def occurrences(label: str, service: Optional[str] = None, since: Optional[int] = None,
+                until: Optional[int] = None, limit: int = 50, tenant: Optional[str] = None,
+                db_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Analyses in which a label appeared (for one tenant, if given), most recent first."""
+    where, args = _where(label, service, "i.start_ts", since, until, prefix="i.")
+    if tenant is not None:
+        where += " AND a.tenant = ?"
+        args.append(tenant)
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT a.fingerprint, a.tenant, a.created, i.label, i.service, i.severity, i.count, i.start_ts, i.end_ts "
+            f"FROM incidents i JOIN analyses a ON a.id = i.analysis_id{where} "
+            "ORDER BY i.start_ts DESC LIMIT ?",
+            [*args, limit],
+        ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
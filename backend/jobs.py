@@ -0,0 +1,364 @@
+# backend/jobs.py
+"""
+Background jobs for long-running analyses (large uploads).
+- Job state lives in SQLite (backend/data/jobs.sqlite), so every uvicorn worker sees the same jobs.
+- Uploads and artifacts (result.json, report.pdf) live in backend/data/jobs/<job_id>/.
+- Work runs in a ProcessPoolExecutor; workers write progress straight into SQLite.
+- Jobs run with a tenant's rule set (rulesets.py); submitting the same content for the same kind
+  and tenant reuses the queued/running/finished job.
+- Finished jobs expire after JOB_TTL seconds and are purged lazily on submit/poll.
+- Queued/running jobs record the pid that owns them (submitting process, then pool worker), and
+  running jobs heartbeat every HEARTBEAT_INTERVAL. A job whose owner died (OOM kill, restart)
+  or whose heartbeat is older than STALE_AFTER is marked failed, so it is never reused.
+- analyze/report jobs are recorded in the incident history like /analyze uploads.
+- analyze/report jobs read the upload in record-aligned chunks (coordinator.analyze_file), so a
+  multi-GB log never sits in memory whole; with SMARTSUPPORT_WORKERS set the chunks go to those
+  workers. clusterize needs every message at once and is limited to CLUSTER_MAX_BYTES.
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional
+import json, multiprocessing, os, shutil, sqlite3, threading, time, uuid
+
+BASE_DIR = os.path.dirname(__file__)
+DATA_DIR = os.path.join(BASE_DIR, "data")
+JOBS_DIR = os.path.join(DATA_DIR, "jobs")
+DB_PATH = os.path.join(DATA_DIR, "jobs.sqlite")
+
+JOB_TTL = int(os.environ.get("SMARTSUPPORT_JOB_TTL", 24 * 3600))  # seconds
+JOB_WORKERS = int(os.environ.get("SMARTSUPPORT_JOB_WORKERS", min(4, os.cpu_count() or 1)))
+KINDS = {"analyze", "report", "clusterize"}
+ACTIVE = ("queued", "running", "done")
+PROGRESS_INTERVAL = 0.5  # seconds between progress writes from a worker
+HEARTBEAT_INTERVAL = 15.0  # seconds between liveness writes from a running job
+STALE_AFTER = float(os.environ.get("SMARTSUPPORT_JOB_STALE_AFTER", 300))  # running job without a heartbeat
+CLUSTER_MAX_BYTES = int(os.environ.get("SMARTSUPPORT_CLUSTER_MAX_BYTES", 256 << 20))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            TEXT PRIMARY KEY,
+    kind          TEXT NOT NULL,
+    fingerprint   TEXT NOT NULL,
+    tenant        TEXT NOT NULL DEFAULT 'base',
+    filename      TEXT,
+    status        TEXT NOT NULL,
+    stage         TEXT,
+    bytes_total   INTEGER DEFAULT 0,
+    bytes_parsed  INTEGER DEFAULT 0,
+    lines_parsed  INTEGER DEFAULT 0,
+    lines_matched INTEGER DEFAULT 0,
+    error         TEXT,
+    created       REAL NOT NULL,
+    updated       REAL NOT NULL,
+    expires       REAL,
+    owner_pid     INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_fp ON jobs (fingerprint, kind, tenant);
+CREATE INDEX IF NOT EXISTS jobs_expires ON jobs (expires);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _connect(db_path: str = DB_PATH) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    cols = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+    if cols and "owner_pid" not in cols:
+        conn.execute("ALTER TABLE jobs ADD COLUMN owner_pid INTEGER")  # databases from before owner tracking
+    if cols and "tenant" not in cols:
+        conn.execute("ALTER TABLE jobs ADD COLUMN tenant TEXT NOT NULL DEFAULT 'base'")  # ... and before tenants
+        conn.execute("DROP INDEX IF EXISTS jobs_fp")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _job_dir(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, job_id)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the server is multithreaded (threadpool, feedback writer, heartbeats),
+            # and a child forked while another thread holds a lock (logging, metrics) can deadlock
+            _pool = ProcessPoolExecutor(max_workers=JOB_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    # a pool whose worker died is broken for good; the next submit starts a fresh one
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _fail(job_id: str, error: str):
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, updated = ?, expires = ? "
+                     "WHERE id = ? AND status IN ('queued', 'running')", (error, now, now + JOB_TTL, job_id))
+    finally:
+        conn.close()
+
+
+def _on_done(job_id: str, pool: ProcessPoolExecutor, fut: Future):
+    # _run_job records its own failures; this catches jobs that never ran or whose process died
+    if fut.cancelled():
+        return _fail(job_id, "cancelled (server shutting down)")
+    exc = fut.exception()
+    if exc is None:
+        return
+    if isinstance(exc, BrokenProcessPool):
+        _discard_pool(pool)
+    _fail(job_id, f"{type(exc).__name__}: {exc}")
+
+
+def _schedule(job_id: str, kind: str, tenant: str):
+    for attempt in (1, 2):
+        pool = _get_pool()
+        try:
+            fut = pool.submit(_run_job, job_id, kind, tenant, DB_PATH, _job_dir(job_id))
+        except (BrokenProcessPool, RuntimeError) as e:  # broken, or shut down under us
+            _discard_pool(pool)
+            if attempt == 2:
+                _fail(job_id, f"{type(e).__name__}: {e}")
+                raise
+            continue
+        fut.add_done_callback(lambda f: _on_done(job_id, pool, f))
+        return
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def recover_stale(now: Optional[float] = None) -> int:
+    """
+    Fail queued/running jobs that can no longer finish: their owner process is gone (pool worker
+    killed, server restarted) or a running job stopped heartbeating. Returns the number failed.
+    """
+    now = now or time.time()
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT id, status, owner_pid, updated FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        stale = []
+        for r in rows:
+            if not _pid_alive(r["owner_pid"]):
+                stale.append((r["id"], r["status"], f"{r['status']} job lost its process (pid {r['owner_pid']})"))
+            elif r["status"] == "running" and now - r["updated"] > STALE_AFTER:
+                stale.append((r["id"], r["status"], f"no heartbeat for {now - r['updated']:.0f}s"))
+        for job_id, status, error in stale:
+            conn.execute("UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, updated = ?, expires = ? "
+                         "WHERE id = ? AND status = ?", (error, now, now + JOB_TTL, job_id, status))
+        return len(stale)
+    finally:
+        conn.close()
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+# ---------------------------
+# Worker side (runs in pool processes)
+# ---------------------------
+def _run_job(job_id: str, kind: str, tenant: str, db_path: str, job_dir: str):
+    from . import rulesets
+    from .analysis import run_clusterize
+    from .coordinator import WORKERS, analyze_file
+
+    conn = _connect(db_path)
+    last = [0.0]
+    stop = threading.Event()
+
+    def heartbeat():
+        hb = _connect(db_path)
+        try:
+            while not stop.wait(HEARTBEAT_INTERVAL):
+                hb.execute("UPDATE jobs SET updated = ? WHERE id = ? AND status = 'running'", (time.time(), job_id))
+        finally:
+            hb.close()
+
+    def progress(stage: str, **counters):
+        now = time.time()
+        if stage == progress.stage and now - last[0] < PROGRESS_INTERVAL:
+            return
+        progress.stage, last[0] = stage, now
+        cols = ["stage = ?", "updated = ?"] + [f"{k} = ?" for k in counters]
+        conn.execute(f"UPDATE jobs SET {', '.join(cols)} WHERE id = ?",
+                     [stage, now, *counters.values(), job_id])
+    progress.stage = None
+
+    try:
+        conn.execute("UPDATE jobs SET status = 'running', owner_pid = ?, updated = ? WHERE id = ?",
+                     (os.getpid(), time.time(), job_id))
+        threading.Thread(target=heartbeat, name="job-heartbeat", daemon=True).start()
+        input_path = os.path.join(job_dir, "input.log")
+
+        if kind == "clusterize":
+            progress("decode")
+            with open(input_path, "rb") as f:
+                raw = f.read().decode(errors="ignore")
+            result = run_clusterize(raw, progress=progress, rules=rulesets.get(tenant).rules)
+            del raw
+        else:
+            # chunk by chunk (here or on the worker nodes); analyze_file records the history entry
+            stage = "dispatch" if WORKERS else "analyze"
+            progress(stage, bytes_parsed=0)
+            result, _ = analyze_file(input_path, WORKERS, tenant=tenant,
+                                     progress=lambda done, total, counts: progress(stage, **counts))
+            progress("merge", lines_parsed=result["totals"].get("TOTAL", 0),
+                     lines_matched=result["coordinator"]["lines_matched"])
+
+        progress("store")
+        with open(os.path.join(job_dir, "result.json"), "w") as f:
+            json.dump(result, f)
+        if kind == "report":
+            from .pdf_report import generate_summary_pdf
+            progress("report")
+            generate_summary_pdf(result, out_path=os.path.join(job_dir, "report.pdf"))
+
+        now = time.time()
+        conn.execute("UPDATE jobs SET status = 'done', stage = 'done', bytes_parsed = bytes_total, "
+                     "updated = ?, expires = ? WHERE id = ?",
+                     (now, now + JOB_TTL, job_id))
+    except Exception as e:
+        now = time.time()
+        conn.execute("UPDATE jobs SET status = 'failed', error = ?, updated = ?, expires = ? WHERE id = ?",
+                     (f"{type(e).__name__}: {e}", now, now + JOB_TTL, job_id))
+    finally:
+        stop.set()
+        conn.close()
+
+
+# ---------------------------
+# API side
+# ---------------------------
+def purge_expired(now: Optional[float] = None) -> int:
+    now = now or time.time()
+    recover_stale(now)
+    conn = _connect()
+    try:
+        ids = [r["id"] for r in conn.execute("SELECT id FROM jobs WHERE expires IS NOT NULL AND expires < ?", (now,))]
+        for job_id in ids:
+            shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return len(ids)
+    finally:
+        conn.close()
+
+
+def submit(upload_path: str, fingerprint: str, kind: str = "analyze", filename: str = "",
+           tenant: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Register a spooled upload as a job and schedule it.
+    upload_path is moved into the job directory, or deleted if an equivalent job already exists
+    or the job is rejected (ValueError: unknown kind or tenant, clusterize upload too large).
+    Returns {"job_id", "status", "reused"}.
+    """
+    from . import rulesets
+
+    try:
+        if kind not in KINDS:
+            raise ValueError(f"unknown job kind: {kind}")
+        if kind == "clusterize" and os.path.getsize(upload_path) > CLUSTER_MAX_BYTES:
+            raise ValueError(f"clusterize jobs are limited to {CLUSTER_MAX_BYTES >> 20}MB; use kind=analyze")
+        rulesets.get(tenant)  # RuleSetError (a ValueError) for unknown/broken sets
+        tenant = tenant or rulesets.BASE
+    except ValueError:
+        os.remove(upload_path)
+        raise
+    purge_expired()
+
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id, status FROM jobs WHERE fingerprint = ? AND kind = ? AND tenant = ? "
+            f"AND status IN ({','.join('?' * len(ACTIVE))}) ORDER BY created DESC LIMIT 1",
+            (fingerprint, kind, tenant, *ACTIVE),
+        ).fetchone()
+        if row is not None:
+            conn.execute("COMMIT")
+        else:
+            job_id = _create(conn, upload_path, fingerprint, kind, filename, tenant)
+            conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+    if row is not None:
+        os.remove(upload_path)
+        return {"job_id": row["id"], "status": row["status"], "reused": True}
+    _schedule(job_id, kind, tenant)
+    return {"job_id": job_id, "status": "queued", "reused": False}
+
+
+def _create(conn: sqlite3.Connection, upload_path: str, fingerprint: str, kind: str, filename: str,
+            tenant: str) -> str:
+    job_id = uuid.uuid4().hex
+    job_dir = _job_dir(job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    shutil.move(upload_path, os.path.join(job_dir, "input.log"))
+    now = time.time()
+    conn.execute(
+        "INSERT INTO jobs (id, kind, fingerprint, tenant, filename, status, stage, bytes_total, created, updated, "
+        "owner_pid) VALUES (?, ?, ?, ?, ?, 'queued', 'queued', ?, ?, ?, ?)",
+        (job_id, kind, fingerprint, tenant, filename, os.path.getsize(os.path.join(job_dir, "input.log")), now, now,
+         os.getpid()),
+    )
+    return job_id
+
+
+def get(job_id: str) -> Optional[Dict[str, Any]]:
+    purge_expired()
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    job["job_id"] = job.pop("id")
+    job["progress"] = round(job["bytes_parsed"] / job["bytes_total"], 3) if job["bytes_total"] else None
+    return job
+
+
+def result_path(job_id: str, name: str = "result.json") -> str:
+    return os.path.join(_job_dir(job_id), name)
+
+
+def load_result(job_id: str) -> Dict[str, Any]:
+    with open(result_path(job_id)) as f:
+        return json.load(f)
+
+
+def new_spool_path() -> str:
+    """Temp path for streaming an upload to disk before it becomes a job."""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    return os.path.join(JOBS_DIR, f".upload-{uuid.uuid4().hex}")
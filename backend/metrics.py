@@ -0,0 +1,251 @@
+# backend/metrics.py
+"""
+In-process metrics with Prometheus text exposition (no client library needed).
+- Counter / Histogram with labels; updates take one lock, and stages are coarse
+  (one observation per stage per request), so overhead stays negligible
+- stage("rules") times a block into smartsupport_stage_seconds{endpoint,stage};
+  the endpoint label comes from a contextvar set by the HTTP middleware
+- CallbackMetric exposes values owned elsewhere (cache hit counters) at scrape time
+- Sampling profiler: with SMARTSUPPORT_PROFILE=1, a request sent with "X-Profile: 1" is sampled
+  and written as folded stacks (flamegraph.pl / speedscope) to backend/data/profiles/
+Values are per process; job workers (jobs.py) run in their own processes and are not included.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import bisect, collections, os, sys, threading, time
+
+BASE_DIR = os.path.dirname(__file__)
+PROFILE_DIR = os.path.join(BASE_DIR, "data", "profiles")
+PROFILING_ENABLED = os.environ.get("SMARTSUPPORT_PROFILE", "0") == "1"
+PROFILE_INTERVAL = float(os.environ.get("SMARTSUPPORT_PROFILE_INTERVAL", 0.005))  # seconds
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_endpoint: ContextVar[str] = ContextVar("smartsupport_endpoint", default="-")
+_profile: ContextVar[Optional["SamplingProfiler"]] = ContextVar("smartsupport_profile", default=None)
+
+LabelKey = Tuple[str, ...]
+
+
+def _fmt_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = ['%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+             for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelKey, float] = collections.defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_fmt_labels(self.labels, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[LabelKey, List[float]] = {}  # per key: bucket counts..., sum, count
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        out = self.header()
+        for key, row in items:
+            acc = 0.0
+            for b, c in zip(self.buckets, row):
+                acc += c
+                le = 'le="%s"' % b
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {acc}")
+            le = 'le="+Inf"'
+            out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {row[-1]}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {row[-2]}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {row[-1]}")
+        return out
+
+
+class CallbackMetric(_Metric):
+    """Values read at scrape time from fn() -> {label tuple: value}."""
+
+    def __init__(self, name, help, labels, fn: Callable[[], Dict[LabelKey, float]], type: str = "gauge"):
+        super().__init__(name, help, labels)
+        self.fn, self.type = fn, type
+
+    def render(self) -> List[str]:
+        return self.header() + [f"{self.name}{_fmt_labels(self.labels, k)} {v}" for k, v in self.fn().items()]
+
+
+REGISTRY: List[_Metric] = []
+
+REQUEST_SECONDS = Histogram("smartsupport_request_seconds", "HTTP request latency", ("method", "endpoint", "status"))
+STAGE_SECONDS = Histogram("smartsupport_stage_seconds", "Time spent per pipeline stage", ("endpoint", "stage"))
+BYTES_PROCESSED = Counter("smartsupport_bytes_processed_total", "Uploaded log bytes analysed", ("endpoint",))
+LINES_PROCESSED = Counter("smartsupport_lines_processed_total", "Parsed log records", ("endpoint",))
+RULE_HITS = Counter("smartsupport_rule_hit_lines_total", "Records matched by at least one rule", ("endpoint",))
+MODEL_LOAD_SECONDS = Histogram("smartsupport_model_load_seconds", "Classifier load time", ("model",))
+RULESET_COMPILE_SECONDS = Histogram("smartsupport_ruleset_compile_seconds", "Rule set compile + lint time", ("ruleset",))
+RESPONSE_BYTES = Histogram("smartsupport_response_bytes", "Encoded response size", ("endpoint",),
+                           buckets=(1e3, 1e4, 1e5, 1e6, 1e7, 1e8))
+
+
+# one family per cache statistic, each with a sample per registered cache: the text format wants
+# all samples of a family together
+CACHES: Dict[str, Any] = {}
+CallbackMetric("smartsupport_cache_hits_total", "Cache hits", ("cache",),
+               lambda: {(name,): c.hits for name, c in list(CACHES.items())}, type="counter")
+CallbackMetric("smartsupport_cache_misses_total", "Cache misses", ("cache",),
+               lambda: {(name,): c.misses for name, c in list(CACHES.items())}, type="counter")
+CallbackMetric("smartsupport_cache_entries", "Cache entries", ("cache",),
+               lambda: {(name,): len(c) for name, c in list(CACHES.items())})
+
+
+def register_cache(name: str, cache) -> None:
+    """Expose an LRUCache's hit/miss counters and size."""
+    CACHES[name] = cache
+
+
+def render() -> str:
+    """Prometheus text exposition format (0.0.4); metrics sharing a name share one header."""
+    seen = set()
+    lines: List[str] = []
+    for m in REGISTRY:
+        out = m.render()
+        if m.name in seen:
+            out = out[2:]
+        seen.add(m.name)
+        lines.extend(out)
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------
+# Request context & stage timers
+# ---------------------------
+def current_endpoint() -> str:
+    return _endpoint.get()
+
+
+def set_endpoint(name: str):
+    return _endpoint.set(name)
+
+
+def reset_endpoint(token):
+    _endpoint.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage; also registers this thread with an active request profile."""
+    prof = _profile.get()
+    if prof is not None:
+        prof.add_thread(threading.get_ident())
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - t0, endpoint=_endpoint.get(), stage=name)
+
+
+# ---------------------------
+# Sampling profiler
+# ---------------------------
+class SamplingProfiler:
+    """
+    Samples the stacks of the threads working on one request (the event loop thread plus any
+    threadpool thread that enters a stage()) and writes folded stacks.
+    """
+
+    def __init__(self, label: str, interval: float = PROFILE_INTERVAL):
+        self.label, self.interval = label, interval
+        self.threads = {threading.get_ident()}
+        self.stacks: Dict[str, int] = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="smartsupport-profiler", daemon=True)
+        self._token = None
+
+    def add_thread(self, ident: int):
+        self.threads.add(ident)
+
+    def __enter__(self):
+        self._token = _profile.set(self)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        _profile.reset(self._token)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.threads):
+                f = frames.get(ident)
+                if f is not None and f.f_code.co_name == "select" and f.f_code.co_filename.endswith("selectors.py"):
+                    continue  # event loop idle, waiting on the threadpool
+                stack = []
+                while f is not None:
+                    co = f.f_code
+                    stack.append(f"{co.co_name} ({os.path.basename(co.co_filename)}:{f.f_lineno})")
+                    f = f.f_back
+                if stack:
+                    self.stacks[";".join(reversed(stack))] += 1
+
+    def dump(self, directory: str = PROFILE_DIR) -> str:
+        os.makedirs(directory, exist_ok=True)
+        safe = "".join(c if c.isalnum() else "_" for c in self.label).strip("_")
+        path = os.path.join(directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{safe}.folded")
+        with open(path, "w") as f:
+            for stack, n in sorted(self.stacks.items(), key=lambda x: -x[1]):
+                f.write(f"{stack} {n}\n")
+        return path
@@ -0,0 +1,424 @@
+# backend/ml_online.py
+"""
+Incrementally trained classifier for the ML fallback.
+- HashingVectorizer (stateless, nothing to refit) + SGDClassifier(log_loss).partial_fit
+- A training run only consumes new examples: feedback newer than the current version's cursor
+  and log files it has not seen, in mini-batches of BATCH_SIZE
+- Each run writes backend/models/online-vNNNN.joblib and records it in registry.json;
+  it becomes current only if its held-out accuracy is not worse than the current one.
+  Version allocation, the dump and the registry write happen under registry.lock (flock),
+  so concurrent runs (threads or uvicorn workers) never share a version number
+- current_model() notices registry changes and hot-swaps the live model
+- old examples are replayed from a bounded reservoir (REPLAY_RATIO per new example), so a
+  batch of one new label does not wipe out the others
+- ~1 in HOLDOUT_MOD examples (chosen by text hash) goes to holdout.jsonl for evaluate();
+  held-out feedback is also scored as its own slice
+- a feedback label the model has not seen waits (in model.pending) until MIN_NEW_CLASS distinct
+  examples exist, so one stray feedback event cannot create a class; rule-labelled log lines
+  add their class directly
+- unmatched WARN/ERROR lines from training logs (what the fallback actually classifies) are kept
+  in fallback.jsonl; a version is promoted only if it changes the confident (>= FALLBACK_CONFIDENCE)
+  prediction of at most max_churn of them, and does not lose accuracy on either held-out slice
+
+CLI: python -m backend.ml_train online|eval|status (see ml_train.py)
+"""
+
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import copy, hashlib, json, os, random, threading, time
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import accuracy_score, f1_score
+
+try:
+    import fcntl  # POSIX only; elsewhere only threads of one process are serialised
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+from .metrics import MODEL_LOAD_SECONDS
+
+BASE_DIR = os.path.dirname(__file__)
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+REGISTRY_PATH = os.path.join(MODELS_DIR, "registry.json")
+REGISTRY_LOCK = os.path.join(MODELS_DIR, "registry.lock")
+HOLDOUT_PATH = os.path.join(MODELS_DIR, "holdout.jsonl")
+FALLBACK_PATH = os.path.join(MODELS_DIR, "fallback.jsonl")
+
+N_FEATURES = 2 ** 18
+BATCH_SIZE = 1024
+HOLDOUT_MOD = 10
+HOLDOUT_MAX = 20000    # most recent held-out examples used for evaluation
+REPLAY_MAX = 5000      # reservoir of past training examples kept with each model version
+REPLAY_RATIO = 2       # replayed old examples per new example, to avoid forgetting
+MIN_NEW_CLASS = 20     # examples a new label needs before it becomes a class
+FALLBACK_MAX = 5000    # most recent unmatched WARN/ERROR lines used for the churn check
+FALLBACK_CONFIDENCE = 0.80  # analysis.ml_fallback only reports predictions at or above this
+OTHER = "Other"
+
+
+class OnlineClassifier:
+    """Hashing vectorizer + SGD; exposes predict_proba/classes_ like the pipeline in ml.py."""
+
+    def __init__(self):
+        self.vec = HashingVectorizer(n_features=N_FEATURES, ngram_range=(1, 2), alternate_sign=False)
+        self.clf: Optional[SGDClassifier] = None
+        self.n_seen = 0
+        self.replay: List[Tuple[str, str]] = []
+        self.n_remembered = 0
+        self.pending: Dict[str, Dict[str, None]] = {}  # new feedback label -> texts, until MIN_NEW_CLASS
+
+    @property
+    def classes_(self):
+        return self.clf.classes_ if self.clf is not None else np.array([])
+
+    def predict_proba(self, texts):
+        return self.clf.predict_proba(self.vec.transform(texts))
+
+    def partial_fit(self, texts: List[str], labels: List[str]):
+        X = self.vec.transform(texts)
+        if self.clf is None:
+            self.clf = SGDClassifier(loss="log_loss", alpha=1e-5, random_state=42)
+            self.clf.partial_fit(X, labels, classes=np.array(sorted(set(labels) | {OTHER})))
+        else:
+            new = set(labels) - set(self.classes_.tolist())
+            if new:
+                self._add_classes(new, X[:1])
+            self.clf.partial_fit(X, labels)
+        self.n_seen += len(texts)
+
+    def remember(self, examples: List[Tuple[str, str]], rnd: random.Random):
+        """Reservoir-sample examples into the replay buffer."""
+        for e in examples:
+            self.n_remembered += 1
+            if len(self.replay) < REPLAY_MAX:
+                self.replay.append(e)
+            else:
+                j = rnd.randrange(self.n_remembered)
+                if j < REPLAY_MAX:
+                    self.replay[j] = e
+
+    def admit(self, weak: List[Tuple[str, str]], feedback: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """
+        Examples to train on. Weak labels (rules, bootstrap) always pass; feedback for a label the
+        model does not know is held back until MIN_NEW_CLASS distinct texts exist, or until the
+        label becomes known some other way (e.g. a rule starts producing it).
+        """
+        if not hasattr(self, "pending"):  # pickled before pending existed
+            self.pending = {}
+        known = set(self.classes_.tolist()) | {OTHER} | {label for _, label in weak}
+        out = list(weak) + [e for e in feedback if e[1] in known]
+        for text, label in feedback:
+            if label not in known:
+                self.pending.setdefault(label, {})[text] = None
+        for label in [l for l, texts in self.pending.items() if l in known or len(texts) >= MIN_NEW_CLASS]:
+            out.extend((t, label) for t in self.pending.pop(label))
+        return out
+
+    def _add_classes(self, new: Iterable[str], X1):
+        """SGD has a fixed class set; rebuild it with extra rows, keeping learned weights."""
+        old = self.clf
+        classes = np.array(sorted(set(old.classes_.tolist()) | set(new)))
+        if old.coef_.shape[0] == 1:  # binary: one row scores classes_[1] against classes_[0]
+            rows = {old.classes_[1]: (old.coef_[0], old.intercept_[0]),
+                    old.classes_[0]: (-old.coef_[0], -old.intercept_[0])}
+        else:
+            rows = {c: (old.coef_[i], old.intercept_[i]) for i, c in enumerate(old.classes_)}
+
+        clf = SGDClassifier(**old.get_params())
+        clf.partial_fit(X1, [classes[0]], classes=classes)  # allocates coef_; overwritten below
+        coef = np.zeros((len(classes), X1.shape[1]))
+        intercept = np.zeros(len(classes))
+        for i, c in enumerate(classes):
+            if c in rows:
+                coef[i], intercept[i] = rows[c]
+        clf.coef_, clf.intercept_ = coef, intercept
+        clf.t_ = old.t_
+        self.clf = clf
+
+
+# ---------------------------
+# Registry & hot swap
+# ---------------------------
+def load_registry() -> Dict[str, Any]:
+    if not os.path.exists(REGISTRY_PATH):
+        return {"current": None, "versions": []}
+    with open(REGISTRY_PATH) as f:
+        return json.load(f)
+
+
+def _save_registry(reg: Dict[str, Any]):
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    tmp = REGISTRY_PATH + f".{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(reg, f, indent=2)
+    os.replace(tmp, REGISTRY_PATH)
+
+
+_registry_lock = threading.Lock()
+
+
+@contextmanager
+def _locked_registry():
+    """Exclusive access to the registry across threads and processes."""
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    with _registry_lock:
+        fd = os.open(REGISTRY_LOCK, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+def _version_path(version: int) -> str:
+    return os.path.join(MODELS_DIR, f"online-v{version:04d}.joblib")
+
+
+def _version_info(reg: Dict[str, Any], version: Optional[int]) -> Dict[str, Any]:
+    return next((v for v in reg["versions"] if v["version"] == version), {})
+
+
+_live: Dict[str, Any] = {"mtime": None, "version": None, "model": None}
+_live_lock = threading.Lock()
+
+
+def current_model(fallback=None):
+    """Registry's current model, reloaded when registry.json changes; fallback if none."""
+    try:
+        mtime = os.stat(REGISTRY_PATH).st_mtime
+    except FileNotFoundError:
+        return fallback
+    if mtime != _live["mtime"]:
+        with _live_lock:
+            if mtime != _live["mtime"]:
+                version = load_registry().get("current")
+                if version is not None and version != _live["version"]:
+                    with MODEL_LOAD_SECONDS.time(model="online"):
+                        _live["model"] = joblib.load(_version_path(version))
+                    _live["version"] = version
+                _live["mtime"] = mtime
+    return _live["model"] if _live["model"] is not None else fallback
+
+
+def current_version() -> Optional[int]:
+    current_model()
+    return _live["version"]
+
+
+# ---------------------------
+# Training data
+# ---------------------------
+Example = Tuple[str, str]  # (text, label)
+
+
+def feedback_examples(store, since: float) -> Tuple[List[Example], float]:
+    """Labelled examples from feedback events newer than `since`; returns (examples, new cursor)."""
+    out: List[Example] = []
+    cursor = since
+    for item in store.query(since=since, limit=1_000_000):
+        ts = float(item.get("last_ts") or item.get("ts") or 0)
+        if ts <= since:
+            continue
+        cursor = max(cursor, ts)
+        texts = item.get("samples") or ([item["text"]] if item.get("text") else [])
+        kind = item.get("type")
+        if kind == "propose_rule" and item.get("label"):
+            label = item["label"]
+        elif kind == "cluster_feedback" and item.get("verdict") == "false_positive":
+            label = OTHER
+        elif kind == "label" and item.get("label"):
+            label = item["label"]
+        else:
+            continue
+        out.extend((t, label) for t in dict.fromkeys(texts) if t)
+    return out, cursor
+
+
+def log_examples(path: str) -> Tuple[List[Example], List[str]]:
+    """
+    Weak labels from real traffic: rule label for matched lines, Other for unmatched INFO/DEBUG.
+    Also returns the unmatched WARN/ERROR messages (unlabelled; the ML fallback's input).
+    """
+    from .parser import parse_text_log
+    from .detector import load_rules, apply_rules
+
+    with open(path, "rb") as f:
+        lines = parse_text_log(f.read().decode(errors="ignore"))
+    hits = apply_rules(lines, load_rules("backend/rules.yaml"))
+    matched = {id(ln) for ln, _ in hits}
+    out = [(ln["message"], m[0]["label"]) for ln, m in hits]
+    unmatched = [ln for ln in lines if id(ln) not in matched]
+    out.extend((ln["message"], OTHER) for ln in unmatched if (ln.get("level") or "").upper() in {"INFO", "DEBUG"})
+    fallback = [ln["message"] for ln in unmatched if (ln.get("level") or "").upper() in {"WARN", "ERROR"}]
+    return out, fallback
+
+
+def _file_fingerprint(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _is_holdout(text: str) -> bool:
+    return int(hashlib.md5(text.encode()).hexdigest()[:8], 16) % HOLDOUT_MOD == 0
+
+
+def load_holdout(source: Optional[str] = None) -> List[Example]:
+    """Held-out examples, optionally only one source ("log" or "feedback")."""
+    if not os.path.exists(HOLDOUT_PATH):
+        return []
+    with open(HOLDOUT_PATH) as f:
+        rows = [json.loads(l) for l in f if l.strip()]
+    if source is not None:
+        rows = [r for r in rows if r.get("source", "log") == source]
+    return [(r["text"], r["label"]) for r in rows[-HOLDOUT_MAX:]]
+
+
+def _append_holdout(examples: List[Example], source: str):
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    with open(HOLDOUT_PATH, "a") as f:
+        for text, label in examples:
+            f.write(json.dumps({"text": text, "label": label, "source": source}) + "\n")
+
+
+def load_fallback() -> List[str]:
+    if not os.path.exists(FALLBACK_PATH):
+        return []
+    with open(FALLBACK_PATH) as f:
+        texts = [json.loads(l)["text"] for l in f if l.strip()]
+    return texts[-FALLBACK_MAX:]
+
+
+def _append_fallback(texts: List[str]):
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    with open(FALLBACK_PATH, "a") as f:
+        for text in texts:
+            f.write(json.dumps({"text": text}) + "\n")
+
+
+# ---------------------------
+# Evaluation & training
+# ---------------------------
+def evaluate(model, examples: List[Example]) -> Dict[str, Any]:
+    if model is None or not examples:
+        return {"n": len(examples), "accuracy": None, "macro_f1": None}
+    texts, labels = zip(*examples)
+    probs = model.predict_proba(list(texts))
+    pred = model.classes_[probs.argmax(axis=1)]
+    return {
+        "n": len(examples),
+        "accuracy": round(float(accuracy_score(labels, pred)), 4),
+        "macro_f1": round(float(f1_score(labels, pred, average="macro", zero_division=0)), 4),
+    }
+
+
+def fallback_churn(model, base, texts: List[str]) -> Optional[float]:
+    """Share of texts whose confident label (None below FALLBACK_CONFIDENCE) differs between models."""
+    if model is None or base is None or not texts:
+        return None
+
+    def confident(m):
+        probs = m.predict_proba(texts)
+        idx = probs.argmax(axis=1)
+        return [m.classes_[i] if p[i] >= FALLBACK_CONFIDENCE else None for p, i in zip(probs, idx)]
+
+    changed = sum(a != b for a, b in zip(confident(model), confident(base)))
+    return round(changed / len(texts), 4)
+
+
+def _not_worse(metrics: Dict[str, Any], baseline: Dict[str, Any], min_delta: float) -> bool:
+    return (baseline["accuracy"] is None or metrics["accuracy"] is None
+            or metrics["accuracy"] >= baseline["accuracy"] - min_delta)
+
+
+def train_incremental(logs: Iterable[str] = (), store=None, min_delta: float = 0.02, max_churn: float = 0.02,
+                      seed: int = 42) -> Dict[str, Any]:
+    """
+    Fold new examples into a copy of the current model and register it as a new version.
+    Cost is proportional to the new examples (replay is a fixed multiple of them; evaluation
+    uses the bounded holdout and fallback sets).
+    """
+    from .ml_train import synthetic_examples
+
+    t0 = time.time()
+    reg = load_registry()
+    cur_info = _version_info(reg, reg.get("current"))
+    cur = joblib.load(_version_path(cur_info["version"])) if cur_info else None
+    cursor = cur_info.get("feedback_cursor", 0.0)
+    seen_logs = set(cur_info.get("logs", []))
+
+    examples: List[Example] = []
+    fb: List[Example] = []
+    if cur is None:
+        examples.extend(zip(*synthetic_examples(600)))  # bootstrap, like ml_train
+    if store is not None:
+        fb, cursor = feedback_examples(store, cursor)
+    for path in logs:
+        fp = _file_fingerprint(path)
+        if fp not in seen_logs:
+            weak, fallback = log_examples(path)
+            examples.extend(weak)
+            _append_fallback(fallback)
+            seen_logs.add(fp)
+    if not examples and not fb:
+        return {"trained": False, "reason": "no new examples", "current": reg.get("current")}
+
+    rnd = random.Random(seed)
+    _append_holdout([e for e in examples if _is_holdout(e[0])], "log")
+    _append_holdout([e for e in fb if _is_holdout(e[0])], "feedback")
+
+    model = copy.deepcopy(cur) if cur is not None else OnlineClassifier()
+    train = model.admit([e for e in examples if not _is_holdout(e[0])], [e for e in fb if not _is_holdout(e[0])])
+    replay = rnd.sample(model.replay, min(len(model.replay), REPLAY_RATIO * len(train)))
+    mixed = train + replay
+    rnd.shuffle(mixed)
+    for i in range(0, len(mixed), BATCH_SIZE):
+        batch = mixed[i:i + BATCH_SIZE]
+        model.partial_fit([t for t, _ in batch], [l for _, l in batch])
+    model.remember(train, rnd)
+
+    holdout = load_holdout()
+    metrics = evaluate(model, holdout)
+    baseline = evaluate(cur, holdout)
+    fb_holdout = load_holdout("feedback")
+    fb_metrics = evaluate(model, fb_holdout)
+    fb_baseline = evaluate(cur, fb_holdout)
+    churn = fallback_churn(model, cur, load_fallback())
+    promote = (_not_worse(metrics, baseline, min_delta) and _not_worse(fb_metrics, fb_baseline, min_delta)
+               and (churn is None or churn <= max_churn))
+
+    info = {
+        "parent": cur_info.get("version"),
+        "created": time.time(),
+        "n_new": len(train),
+        "n_replayed": len(replay),
+        "n_seen": model.n_seen,
+        "classes": model.classes_.tolist(),
+        "pending": {label: len(texts) for label, texts in model.pending.items()},
+        "eval": metrics,
+        "baseline_eval": baseline,
+        "feedback_eval": fb_metrics,
+        "baseline_feedback_eval": fb_baseline,
+        "fallback_churn": churn,
+        "promoted": promote,
+        "feedback_cursor": cursor,
+        "logs": sorted(seen_logs),
+    }
+    with _locked_registry():
+        reg = load_registry()  # re-read: another run may have registered meanwhile
+        version = max([v["version"] for v in reg["versions"]], default=0) + 1
+        joblib.dump(model, _version_path(version))
+        info = {"version": version, **info, "train_seconds": round(time.time() - t0, 3)}
+        reg["versions"].append(info)
+        if promote:
+            reg["current"] = version
+        _save_registry(reg)
+    return {"trained": True, **info}
@@ -1,20 +1,63 @@
+"""
+python -m backend.ml_train                      # full refit on synthetic data -> backend/model.joblib
+python -m backend.ml_train online [--logs ...]  # incremental update -> backend/models/ (ml_online.py)
+python -m backend.ml_train eval                 # current online model on the held-out set
+python -m backend.ml_train status               # online model registry
+"""
+import argparse, json
+
 from .synth import generate
 from .ml import train_and_save
 
-def main():
+
+def heuristic_label(msg: str) -> str:
     # crude labels from templates; use simple heuristics here
-    data = generate(600)
-    texts, labels = [], []
-    for line in data.splitlines():
-        msg = line.split(" - ", 1)[-1]
-        texts.append(msg)
-        if "license" in msg.lower(): labels.append("License Check Failure")
-        elif "timed out" in msg.lower(): labels.append("Database Timeout")
-        elif "authentication failed" in msg.lower(): labels.append("Authentication Failure")
-        elif " 5" in msg: labels.append("HTTP 5xx")
-        else: labels.append("Other")
-    train_and_save(texts, labels)
-    print("Model trained and saved to backend/model.joblib")
+    low = msg.lower()
+    if "license" in low: return "License Check Failure"
+    elif "timed out" in low: return "Database Timeout"
+    elif "authentication failed" in low: return "Authentication Failure"
+    elif " 5" in msg: return "HTTP 5xx"
+    else: return "Other"
+
+
+def synthetic_examples(n: int = 600):
+    texts = [line.split(" - ", 1)[-1] for line in generate(n).splitlines()]
+    return texts, [heuristic_label(t) for t in texts]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Train the ML fallback classifier")
+    sub = ap.add_subparsers(dest="cmd")
+    on = sub.add_parser("online", help="fold new feedback/logs into a new online model version")
+    on.add_argument("--logs", nargs="*", default=[], help="log files to harvest rule-labelled examples from")
+    on.add_argument("--no-feedback", action="store_true")
+    on.add_argument("--min-delta", type=float, default=0.02, help="max held-out accuracy drop still promoted")
+    on.add_argument("--max-churn", type=float, default=0.02,
+                    help="max share of unmatched WARN/ERROR lines whose confident prediction may change")
+    sub.add_parser("eval")
+    sub.add_parser("status")
+    args = ap.parse_args()
+
+    if args.cmd is None:
+        texts, labels = synthetic_examples(600)
+        train_and_save(texts, labels)
+        print("Model trained and saved to backend/model.joblib")
+        return
+
+    from . import ml_online
+    if args.cmd == "online":
+        store = None
+        if not args.no_feedback:
+            from .feedback_store import FeedbackStore
+            store = FeedbackStore("backend/feedback.jsonl")
+        out = ml_online.train_incremental(logs=args.logs, store=store, min_delta=args.min_delta,
+                                            max_churn=args.max_churn)
+    elif args.cmd == "eval":
+        out = ml_online.evaluate(ml_online.current_model(), ml_online.load_holdout())
+        out["version"] = ml_online.current_version()
+    else:
+        out = ml_online.load_registry()
+    print(json.dumps(out, indent=2))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,42 +1,401 @@
+import gc
+import os
 import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from dateutil import parser as dtparser
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Callable, Optional, Union
+
+import yaml
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except Exception:  # orjson is optional; stdlib json is ~3x slower on this path
+    import json
+    _json_loads = json.loads
 
 TS_RGX = re.compile(
     r"^(?P<ts>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?Z)\s+\[(?P<level>[A-Z]+)\]\s+(?P<service>[\w-]+)\s+(?P<host>[\w-]+)\s+-\s+(?P<msg>.*)$"
 )
-def parse_text_log(text: str) -> List[Dict[str, Any]]:
-    lines = text.splitlines()
-    out: List[Dict[str, Any]] = []
-    buf: List[str] = []
-
-    def flush(buf):
-        if not buf: return
-        head = buf[0]
-        m = TS_RGX.match(head)
-        if m:
-            d = m.groupdict()
-            entry = {
-                "ts": d["ts"],
-                "level": d.get("level"),
-                "service": d.get("service"),
-                "host": d.get("host"),
-                "code": None,
-                "message": d.get("msg") if len(buf)==1 else "\n".join([d.get("msg")] + buf[1:]),
-                "attrs": {}
-            }
-            out.append(entry)
-        buf.clear()
-
-    for raw in lines:
-        if TS_RGX.match(raw):
-            flush(buf)
-            buf.append(raw)
-        else:
-            # continuation (stack trace)
-            if not buf: # orphan line, treat as message only
-                out.append({"ts": None, "level": None, "service": None, "host": None, "code": None, "message": raw, "attrs": {}})
+PROGRESS_EVERY = 20000  # lines between progress callbacks
+SNIFF_CHARS = 8192      # how much of an upload detect_format() looks at
+FORMATS_PATH = os.path.join(os.path.dirname(__file__), "log_formats.yaml")
+
+
+def to_epoch(ts: Optional[str]) -> Optional[int]:
+    """
+    ISO-8601 timestamp -> epoch seconds (naive timestamps are taken as UTC).
+    fromisoformat handles the parser's own format; dateutil covers the rest. None if unparseable.
+    """
+    if not ts:
+        return None
+    try:
+        d = datetime.fromisoformat(ts[:-1] + "+00:00" if ts.endswith("Z") else ts)
+    except ValueError:
+        try:
+            d = dtparser.parse(ts)
+        except (ValueError, OverflowError):
+            return None
+    if d.tzinfo is None:
+        d = d.replace(tzinfo=timezone.utc)
+    return int(d.timestamp())
+
+
+# ---------------------------
+# Field normalisation (shared by all formats)
+# ---------------------------
+# Records always use ISO-8601 UTC 'YYYY-MM-DDTHH:MM:SS[.fff]Z' timestamps and upper-case levels,
+# so minute bucketing, rules and the ML fallback behave the same whatever the input format.
+_ISO_Z = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?Z$")
+_LEVELS = {
+    "WARNING": "WARN", "ERR": "ERROR", "FATAL": "ERROR", "CRITICAL": "ERROR", "CRIT": "ERROR",
+    "PANIC": "ERROR", "EMERG": "ERROR", "ALERT": "ERROR", "SEVERE": "ERROR", "NOTICE": "INFO",
+    "INFORMATION": "INFO", "TRACE": "DEBUG", "DBG": "DEBUG",
+}
+# aliases, first match wins; whatever is left over goes to attrs
+TS_KEYS = ("ts", "timestamp", "time", "@timestamp", "datetime", "date")
+LEVEL_KEYS = ("level", "severity", "lvl", "loglevel", "log.level", "levelname")
+SERVICE_KEYS = ("service", "service.name", "app", "application", "logger", "component")
+HOST_KEYS = ("host", "hostname", "host.name", "node")
+CODE_KEYS = ("code", "error_code", "error.code", "err_code", "status_code", "status")
+MSG_KEYS = ("message", "msg", "log", "text", "event")
+# the lookbehind starts a key only at the beginning of a word, so words without "=" are not
+# rescanned from every position (same matches, ~25% faster on messages that contain "=")
+_KV = re.compile(r'(?<![\w.\-/@])([\w.\-/@]+)=("(?:[^"\\]|\\.)*"|[^\s"]*)')
+_UNESCAPE = re.compile(r"\\(.)")
+
+
+def _level(v: Any) -> Optional[str]:
+    if v is None or v == "":
+        return None
+    lvl = str(v).upper()
+    return _LEVELS.get(lvl, lvl)
+
+
+def _to_iso(v: Any) -> Optional[str]:
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        try:
+            d = datetime.fromtimestamp(v / 1000 if v > 1e11 else v, tz=timezone.utc)  # epoch ms or s
+        except (OSError, OverflowError, ValueError):
+            return None  # out of range / NaN: not a timestamp
+    else:
+        s = str(v).strip()
+        if not s or s == "-":
+            return None
+        if _ISO_Z.match(s):
+            return s
+        try:
+            d = datetime.fromisoformat(s[:-1] + "+00:00" if s.endswith("Z") else s)
+        except ValueError:
+            try:
+                d = dtparser.parse(s)
+            except (ValueError, OverflowError):
+                return s  # keep what we were given rather than drop it
+    d = d.astimezone(timezone.utc) if d.tzinfo else d
+    return d.strftime("%Y-%m-%dT%H:%M:%S") + (f".{d.microsecond // 1000:03d}Z" if d.microsecond else "Z")
+
+
+def _ts(v: Any, cache: Dict[Any, Optional[str]]) -> Optional[str]:
+    """Normalised timestamp; cache is per parse call (consecutive lines share timestamps)."""
+    if v is None:
+        return None
+    r = cache.get(v)
+    if r is None:
+        if len(cache) > 100000:
+            cache.clear()
+        r = cache[v] = _to_iso(v)
+    return r
+
+
+def _scalar(v: Any) -> Optional[str]:
+    return None if v is None or isinstance(v, (dict, list)) else str(v)
+
+
+def _pop(d: Dict[str, Any], keys) -> Any:
+    for k in keys:
+        if k in d and not isinstance(d[k], (dict, list)):
+            return d.pop(k)
+    return None
+
+
+def _record(d: Dict[str, Any], raw: str, cache: Dict) -> Dict[str, Any]:
+    """Structured fields (JSON object, logfmt pairs) -> record; unknown keys become attrs."""
+    msg = _pop(d, MSG_KEYS)
+    return {
+        "ts": _ts(_pop(d, TS_KEYS), cache),
+        "level": _level(_pop(d, LEVEL_KEYS)),
+        "service": _scalar(_pop(d, SERVICE_KEYS)),
+        "host": _scalar(_pop(d, HOST_KEYS)),
+        "code": _scalar(_pop(d, CODE_KEYS)),
+        "message": raw if msg is None else str(msg),
+        "attrs": d,
+    }
+
+
+def kv_pairs(text: str) -> Dict[str, str]:
+    """key=value / key="quoted value" pairs (logfmt)."""
+    if '"' not in text:
+        return dict(_KV.findall(text))
+    out = {}
+    for k, v in _KV.findall(text):
+        if v[:1] == '"':
+            v = v[1:-1]
+            if "\\" in v:
+                v = _UNESCAPE.sub(r"\1", v)
+        out[k] = v
+    return out
+
+
+# ---------------------------
+# Formats
+# ---------------------------
+class LogFormat:
+    """
+    One log format. parse_line() returns a record for a line that starts a record, else None;
+    with multiline=True, non-matching lines after a record are appended to its message
+    (stack traces), otherwise they become orphan records.
+    """
+    name = "base"
+    multiline = True
+
+    def parse_line(self, line: str, cache: Dict) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def sniff(self, line: str) -> bool:
+        return self.parse_line(line, {}) is not None
+
+
+class RegexFormat(LogFormat):
+    """
+    Named groups ts, level, service, host, code, msg map to record fields; any other named
+    group goes to attrs. key=value pairs in the message are added to attrs as well.
+    """
+    FIELDS = ("ts", "level", "service", "host", "code", "msg")
+
+    def __init__(self, name: str, pattern: Union[str, "re.Pattern"], multiline: bool = True, kv_attrs: bool = True):
+        self.name = name
+        self.rx = re.compile(pattern) if isinstance(pattern, str) else pattern
+        self.multiline = multiline
+        self.kv_attrs = kv_attrs
+        self.extra = [g for g in self.rx.groupindex if g not in self.FIELDS]
+
+    def parse_line(self, line, cache):
+        m = self.rx.match(line)
+        if m is None:
+            return None
+        d = m.groupdict()
+        msg = d.get("msg") or ""
+        attrs = {k: d[k] for k in self.extra if d[k] is not None} if self.extra else {}
+        if self.kv_attrs and "=" in msg:
+            attrs.update(kv_pairs(msg))
+        code = d.get("code")
+        if code is None and attrs:
+            code = next((attrs[k] for k in CODE_KEYS if k in attrs), None)
+        return {
+            "ts": _ts(d.get("ts"), cache),
+            "level": _level(d.get("level")),
+            "service": d.get("service"),
+            "host": d.get("host"),
+            "code": code,
+            "message": msg,
+            "attrs": attrs,
+        }
+
+
+class JsonLinesFormat(LogFormat):
+    """One JSON object per line (orjson when installed)."""
+    name = "jsonl"
+
+    def parse_line(self, line, cache):
+        if not line.startswith("{"):
+            s = line.lstrip()
+            if not s.startswith("{"):
+                return None
+            line = s
+        try:
+            obj = _json_loads(line)
+        except ValueError:
+            return None
+        if not isinstance(obj, dict):
+            return None
+        return _record(obj, line, cache)
+
+
+class LogfmtFormat(LogFormat):
+    """key=value pairs; a line needs 2+ pairs including a level, message or time key."""
+    name = "logfmt"
+    _MARKERS = set(TS_KEYS + LEVEL_KEYS + MSG_KEYS)
+
+    def parse_line(self, line, cache):
+        if "=" not in line:
+            return None
+        d = kv_pairs(line)
+        if len(d) < 2 or not self._MARKERS.intersection(d):
+            return None
+        return _record(d, line, cache)
+
+
+class SyslogFormat(LogFormat):
+    """RFC 5424: <PRI>1 TIMESTAMP HOSTNAME APP-NAME PROCID MSGID [SD] MSG."""
+    name = "syslog"
+    RX = re.compile(
+        r'^<(?P<pri>\d{1,3})>1 (?P<ts>\S+) (?P<host>\S+) (?P<app>\S+) (?P<procid>\S+) (?P<msgid>\S+) '
+        r'(?P<sd>-|(?:\[(?:[^\]"\\]|\\.|"(?:[^"\\]|\\.)*")*\])+)(?: (?P<msg>.*))?$'
+    )
+    SD_ELEMENT = re.compile(r'\[([^\s\]]+)((?:\s+[^=\s\]]+="(?:[^"\\]|\\.)*")*)\s*\]')
+    SEVERITY = ("ERROR", "ERROR", "ERROR", "ERROR", "WARN", "INFO", "INFO", "DEBUG")
+
+    def parse_line(self, line, cache):
+        if not line.startswith("<"):
+            return None
+        m = self.RX.match(line)
+        if m is None:
+            return None
+        pri = int(m.group("pri"))
+        nil = lambda v: None if v == "-" else v
+        attrs: Dict[str, Any] = {"facility": pri >> 3, "severity": pri & 7}
+        if m.group("procid") != "-":
+            attrs["procid"] = m.group("procid")
+        sd = m.group("sd")
+        if sd != "-":
+            for sd_id, params in self.SD_ELEMENT.findall(sd):
+                attrs[sd_id] = kv_pairs(params)
+        msg = m.group("msg") or ""
+        return {
+            "ts": _ts(nil(m.group("ts")), cache),
+            "level": self.SEVERITY[pri & 7],
+            "service": nil(m.group("app")),
+            "host": nil(m.group("host")),
+            "code": nil(m.group("msgid")),
+            "message": msg[1:] if msg.startswith("\ufeff") else msg,  # strip BOM
+            "attrs": attrs,
+        }
+
+
+# ---------------------------
+# Registry & detection
+# ---------------------------
+# default-format messages carry key=value pairs too (org_id=, user=, job=, latency=); extraction
+# only runs on messages containing "=" and costs ~0.2s per 20MB of such logs
+DEFAULT_FORMAT = RegexFormat("default", TS_RGX)
+FORMATS: Dict[str, LogFormat] = {}  # in sniffing priority order
+
+
+def register_format(fmt: LogFormat) -> LogFormat:
+    FORMATS[fmt.name] = fmt
+    return fmt
+
+
+def load_formats(path: str = FORMATS_PATH) -> List[RegexFormat]:
+    """
+    Regex formats from YAML, compiled once:
+      - name: python_logging
+        pattern: '^(?P<ts>...) (?P<level>[A-Z]+) (?P<service>[\\w.]+): (?P<msg>.*)$'
+        multiline: true      # optional
+    """
+    if not os.path.exists(path):
+        return []
+    items = yaml.safe_load(open(path)) or []
+    return [register_format(RegexFormat(i["name"], i["pattern"], i.get("multiline", True), i.get("kv_attrs", True)))
+            for i in items]
+
+
+for _fmt in (JsonLinesFormat(), SyslogFormat(), DEFAULT_FORMAT):
+    register_format(_fmt)
+load_formats()
+register_format(LogfmtFormat())  # loosest check, sniffed last
+
+
+def detect_format(text: str, sample_chars: int = SNIFF_CHARS) -> LogFormat:
+    """Pick the format that recognises the most lines in the first sample_chars of text."""
+    sample = text[:sample_chars].splitlines()
+    if len(text) > sample_chars and len(sample) > 1:
+        sample = sample[:-1]  # last line is probably cut off
+    sample = [ln for ln in sample if ln.strip()]
+    best, best_n = DEFAULT_FORMAT, 0
+    for fmt in FORMATS.values():
+        n = sum(1 for ln in sample if fmt.sniff(ln))
+        if n > best_n:
+            best, best_n = fmt, n
+    return best
+
+
+# ---------------------------
+# Parsing
+# ---------------------------
+# records are acyclic dicts; left on, the cyclic GC rescans the growing list over and over (about
+# a third of the parse time on large uploads). Parses run concurrently (threadpool, coordinator
+# worker threads), so the process-wide flag is shared: the first parse to start turns GC off and
+# the last one to finish restores it.
+_gc_lock = threading.Lock()
+_gc_state = {"parses": 0, "was_enabled": False}
+
+
+@contextmanager
+def _gc_paused():
+    with _gc_lock:
+        if _gc_state["parses"] == 0:
+            _gc_state["was_enabled"] = gc.isenabled()
+            gc.disable()
+        _gc_state["parses"] += 1
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _gc_state["parses"] -= 1
+            if _gc_state["parses"] == 0 and _gc_state["was_enabled"]:
+                gc.enable()
+
+
+def parse_text_log(text: str, progress: Optional[Callable[[int, int], None]] = None,
+                   fmt: Union[str, LogFormat, None] = None) -> List[Dict[str, Any]]:
+    """
+    progress: optional callback(chars_consumed, lines_seen), called every PROGRESS_EVERY lines
+    fmt: a LogFormat or registered name; detected from the start of text when omitted
+    Each record carries lineno (1-based, first line of the record) and offset (character
+    offset of that line in `text`, exact for \n line endings) so clients can refer back to it.
+    """
+    if fmt is None:
+        fmt = detect_format(text)
+    elif isinstance(fmt, str):
+        fmt = FORMATS[fmt]
+    parse_line, multiline = fmt.parse_line, fmt.multiline
+    cache: Dict[Any, Optional[str]] = {}
+
+    with _gc_paused():
+        lines = text.splitlines()
+        out: List[Dict[str, Any]] = []
+        cont: List[str] = []   # continuation lines of out[-1]
+        have_head = False
+
+        consumed = 0
+        for i, raw in enumerate(lines, 1):
+            start = consumed
+            consumed += len(raw) + 1
+            if progress is not None and i % PROGRESS_EVERY == 0:
+                progress(consumed, i)
+            entry = parse_line(raw, cache)
+            if entry is not None:
+                if cont:
+                    out[-1]["message"] = "\n".join([out[-1]["message"]] + cont)
+                    cont = []
+                entry["lineno"] = i
+                entry["offset"] = start
+                out.append(entry)
+                have_head = True
+            elif have_head and multiline:
+                # continuation (stack trace)
+                cont.append(raw)
             else:
-                buf.append(raw)
-    flush(buf)
-    return out
\ No newline at end of file
+                # orphan line, treat as message only
+                out.append({"ts": None, "level": None, "service": None, "host": None, "code": None, "message": raw,
+                            "attrs": {}, "lineno": i, "offset": start})
+        if cont:
+            out[-1]["message"] = "\n".join([out[-1]["message"]] + cont)
+    if progress is not None:
+        progress(len(text), len(lines))
+    return out
@@ -1,17 +1,59 @@
 # backend/pdf_report.py
+"""
+PDF summary report.
+Built only from precomputed aggregates (totals, incidents, per-minute timeline), so render
+time stays linear in the number of incidents:
+- incidents go into fixed-width LongTables of ROWS_PER_TABLE rows (header repeated), which
+  avoids reportlab re-measuring one huge table on every page split
+- the volume timeline is drawn once as a vector chart, downsampled to at most CHART_POINTS bins
+- per-service sections are optional (per_service=True)
+"""
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, LongTable, TableStyle
+from reportlab.graphics.shapes import Drawing, PolyLine, Line, String
 from reportlab.lib import colors
 from datetime import datetime
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+import os, tempfile
 
-def generate_summary_pdf(data, out_path="backend/report.pdf"):
+ROWS_PER_TABLE = 50       # incident rows per LongTable chunk
+CHART_POINTS = 480        # max bins drawn in the timeline chart
+CELL_CHARS = 45           # root cause cells are plain strings, clipped to this width
+INCIDENT_COLS = [110, 45, 35, 70, 191]  # fits the A4 frame (451pt)
+
+_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+])
+
+
+def generate_summary_pdf(data, out_path="backend/report.pdf", **opts):
+    """
+    data: dict from /analyze API response
+    out_path: PDF file path to write (written atomically via a unique temp file)
+    """
+    pdf = render_summary_pdf(data, **opts)
+    fd, tmp = tempfile.mkstemp(suffix=".pdf", dir=os.path.dirname(out_path) or ".")
+    with os.fdopen(fd, "wb") as f:
+        f.write(pdf)
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def render_summary_pdf(data, per_service: bool = False, max_incidents: Optional[int] = None) -> bytes:
     """
     data: dict from /analyze API response
-    out_path: PDF file path to write
+    per_service: append one incident section per service
+    max_incidents: optional cap on incident rows (None = all)
+    Returns the PDF as bytes; nothing shared is touched, so concurrent renders are safe.
     """
-    doc = SimpleDocTemplate(out_path, pagesize=A4)
+    buf = BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4)
     story = []
     styles = getSampleStyleSheet()
     title = ParagraphStyle('TitleCenter', parent=styles['Title'], alignment=TA_CENTER)
@@ -40,32 +82,95 @@ def generate_summary_pdf(data, out_path="backend/report.pdf"):
     story.append(table)
     story.append(Spacer(1, 20))
 
+    # Timeline
+    timeline = data.get("timeline") or {}
+    if timeline:
+        story.append(Paragraph("<b>Volume per minute</b>", styles['Heading2']))
+        story.append(timeline_chart(timeline, spikes=(data.get("anomaly") or {}).get("spikes", [])))
+        story.append(Spacer(1, 20))
+
     # Incidents
     incidents = data.get("incidents", [])
+    if max_incidents is not None:
+        incidents = incidents[:max_incidents]
     if incidents:
-        story.append(Paragraph("<b>Incidents</b>", styles['Heading2']))
-        i_data = [["Label", "Severity", "Count", "Root Cause"]]
-        for inc in incidents[:8]:  # top 8 only
-            i_data.append([inc["label"], inc["severity"], str(inc["count"]), inc["root_cause"]])
-        i_table = Table(i_data, hAlign='LEFT')
-        i_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
-        ]))
-        story.append(i_table)
+        story.append(Paragraph(f"<b>Incidents</b> ({len(incidents)})", styles['Heading2']))
+        story.extend(incident_tables(incidents))
         story.append(Spacer(1, 20))
 
-    # Recommendations
+    # Recommendations (deduplicated, all incidents)
     story.append(Paragraph("<b>Recommendations</b>", styles['Heading2']))
-    recs = []
-    for inc in incidents[:5]:
-        recs.extend(inc.get("recommend", []))
+    recs = list(dict.fromkeys(r for inc in incidents for r in inc.get("recommend", [])))
     if recs:
         for r in recs:
             story.append(Paragraph(f"• {r}", styles['Normal']))
     else:
         story.append(Paragraph("No recommendations found.", styles['Normal']))
 
+    if per_service and incidents:
+        for svc, items in group_by_service(incidents).items():
+            story.append(Spacer(1, 20))
+            story.append(Paragraph(f"<b>Service: {svc}</b> ({len(items)} incidents)", styles['Heading2']))
+            story.extend(incident_tables(items))
+
     doc.build(story)
-    return out_path
\ No newline at end of file
+    return buf.getvalue()
+
+
+def _clip(text: Any, n: int = CELL_CHARS) -> str:
+    text = "" if text is None else str(text)
+    return text if len(text) <= n else text[: n - 1] + "…"
+
+
+def incident_tables(incidents: List[Dict[str, Any]]) -> List[LongTable]:
+    header = ["Label", "Severity", "Count", "Service", "Root Cause"]
+    out = []
+    for i in range(0, len(incidents), ROWS_PER_TABLE):
+        rows = [header] + [
+            [_clip(inc.get("label"), 24), inc.get("severity", ""), str(inc.get("count", 0)),
+             _clip(inc.get("service") or "-", 15), _clip(inc.get("root_cause"))]
+            for inc in incidents[i:i + ROWS_PER_TABLE]
+        ]
+        t = LongTable(rows, colWidths=INCIDENT_COLS, repeatRows=1, hAlign='LEFT')
+        t.setStyle(_TABLE_STYLE)
+        out.append(t)
+    return out
+
+
+def group_by_service(incidents: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for inc in incidents:
+        for svc in (inc.get("service") or "unknown").split(", "):
+            groups.setdefault(svc, []).append(inc)
+    return dict(sorted(groups.items()))
+
+
+def timeline_chart(timeline: Dict[str, int], spikes: List[str] = (), width: float = 450, height: float = 140) -> Drawing:
+    """Line chart of per-minute volume; bins are merged (max) down to CHART_POINTS."""
+    keys = list(timeline.keys())
+    vals = list(timeline.values())
+    step = max(1, -(-len(vals) // CHART_POINTS))
+    bins = [max(vals[i:i + step]) for i in range(0, len(vals), step)]
+    if len(bins) == 1:
+        bins = bins * 2
+    pos = {k: i for i, k in enumerate(keys)}
+    spike_bins = {pos[k] // step for k in spikes if k in pos}
+    top = max(bins) or 1
+
+    pad = 24
+    w, h = width - pad, height - pad
+    dx = w / max(1, len(bins) - 1)
+    d = Drawing(width, height)
+    d.add(Line(pad, pad, width, pad, strokeColor=colors.grey, strokeWidth=0.5))
+    d.add(Line(pad, pad, pad, height, strokeColor=colors.grey, strokeWidth=0.5))
+    pts = []
+    for i, v in enumerate(bins):
+        pts.extend([pad + i * dx, pad + v / top * h])
+    d.add(PolyLine(pts, strokeColor=colors.steelblue, strokeWidth=0.8))
+    for i in sorted(spike_bins):
+        x = pad + i * dx
+        d.add(Line(x, pad, x, height, strokeColor=colors.red, strokeWidth=0.4))
+    d.add(String(0, height - 8, str(top), fontSize=7, fontName="Helvetica"))
+    d.add(String(pad, 4, keys[0], fontSize=7, fontName="Helvetica"))
+    d.add(String(width, 4, keys[-1], fontSize=7, fontName="Helvetica", textAnchor="end"))
+    return d
@@ -0,0 +1,163 @@
+# backend/rulesets.py
+"""
+Per-tenant / per-product rule sets.
+- "base" is backend/rules.yaml; backend/rulesets/<name>.yaml defines the others:
+      extends: base            # parent set (default: see below); chains are allowed
+      disable: [rule_id, ...]  # drop inherited rules
+      overrides:               # change fields of inherited rules
+        db_timeout: {severity: Medium}
+      rules: [...]             # extra rules, same shape as rules.yaml; a known id replaces it
+  Product sets use dotted names ("acme.billing"); without extends they inherit from the set
+  named by the prefix ("acme"), and undotted sets from base.
+- A resolved set is versioned by a hash of its final rule definitions. Compiled sets are kept
+  in an LRU keyed by that version, so tenants with identical rules share one entry and an edit
+  anywhere in the chain yields a new version (the old one ages out).
+- get() only re-reads YAML when a file in the chain changed (mtime/size); otherwise a request
+  costs a few stat() calls and dictionary lookups, never a recompile.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib, json, logging, os, re, sys, threading, time
+
+import yaml
+
+from .cache import LRUCache
+from .detector import Rule, build_rules
+from .metrics import RULESET_COMPILE_SECONDS
+
+log = logging.getLogger(__name__)
+
+BASE = "base"
+BASE_PATH = "backend/rules.yaml"
+RULESETS_DIR = os.path.join(os.path.dirname(__file__), "rulesets")
+MAX_DEPTH = 8
+_NAME = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_.\-]{0,63}$")
+
+
+class RuleSetError(ValueError):
+    pass
+
+
+class CompiledRuleSet:
+    def __init__(self, name: str, version: str, rules: List[Rule], compile_ms: float):
+        self.name = name
+        self.version = version
+        self.rules = rules
+        self.compile_ms = compile_ms
+        self.nbytes = sizeof_rules(rules)
+
+    def info(self) -> Dict[str, Any]:
+        return {"name": self.name, "version": self.version, "rules": len(self.rules),
+                "compile_ms": round(self.compile_ms, 2), "bytes": self.nbytes}
+
+
+COMPILED = LRUCache(maxsize=int(os.environ.get("SMARTSUPPORT_RULESET_CACHE", 32)))  # version -> CompiledRuleSet
+_resolved: Dict[str, Tuple[List[str], Optional[Tuple], str, List[Dict[str, Any]]]] = {}  # name -> (chain, signature, version, defs)
+_lock = threading.Lock()
+
+
+def sizeof_rules(rules: List[Rule]) -> int:
+    """Approximate memory held by compiled rules (objects, compiled patterns, strings)."""
+    n = 0
+    for r in rules:
+        n += sys.getsizeof(r) + sys.getsizeof(r.__dict__) + sys.getsizeof(r.pattern) + sys.getsizeof(r.stats)
+        n += sum(sys.getsizeof(v) for v in (r.id, r.pattern.pattern, r.label, r.severity, r.root_cause))
+        n += sys.getsizeof(r.recommend) + sum(sys.getsizeof(x) for x in r.recommend)
+    return n
+
+
+def _path(name: str) -> str:
+    return BASE_PATH if name == BASE else os.path.join(RULESETS_DIR, f"{name}.yaml")
+
+
+def _parent(name: str) -> str:
+    # default for `extends`: "acme.billing" -> "acme", "acme" -> base
+    return name.rsplit(".", 1)[0] if "." in name else BASE
+
+
+def available() -> List[str]:
+    names = [f[:-5] for f in os.listdir(RULESETS_DIR) if f.endswith(".yaml")] if os.path.isdir(RULESETS_DIR) else []
+    return [BASE] + sorted(n for n in names if _NAME.match(n))
+
+
+def _resolve(name: str, seen: Tuple[str, ...] = ()) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """(final rule definitions, files in the chain)"""
+    if not _NAME.match(name):
+        raise RuleSetError(f"invalid rule set name: {name!r}")
+    if name in seen:
+        raise RuleSetError(f"rule set inheritance cycle: {' -> '.join(seen + (name,))}")
+    if len(seen) >= MAX_DEPTH:
+        raise RuleSetError(f"rule set chain deeper than {MAX_DEPTH}: {name}")
+    path = _path(name)
+    if not os.path.exists(path):
+        raise RuleSetError(f"unknown rule set: {name}")
+    try:
+        with open(path) as f:
+            doc = yaml.safe_load(f)
+    except yaml.YAMLError as e:
+        raise RuleSetError(f"rule set {name}: invalid YAML: {e}") from e
+    if name == BASE:
+        return [dict(d) for d in doc], [path]
+
+    doc = doc or {}
+    if not isinstance(doc, dict):
+        raise RuleSetError(f"rule set {name}: expected a mapping with extends/disable/overrides/rules")
+    defs, chain = _resolve(doc.get("extends", _parent(name)), seen + (name,))
+    by_id = {d["id"]: d for d in defs}
+    for rid in doc.get("disable") or []:
+        if by_id.pop(rid, None) is None:
+            log.warning("rule set %s: cannot disable unknown rule %s", name, rid)
+    for rid, fields in (doc.get("overrides") or {}).items():
+        if rid not in by_id:
+            log.warning("rule set %s: cannot override unknown rule %s", name, rid)
+            continue
+        by_id[rid] = {**by_id[rid], **fields, "id": rid}
+    for d in doc.get("rules") or []:
+        by_id[d["id"]] = dict(d)
+    return list(by_id.values()), chain + [path]
+
+
+def _signature(chain: List[str]) -> Optional[Tuple]:
+    try:
+        return tuple((p, st.st_mtime_ns, st.st_size) for p, st in ((p, os.stat(p)) for p in chain))
+    except FileNotFoundError:
+        return None
+
+
+def get(name: Optional[str] = None) -> CompiledRuleSet:
+    """Compiled rule set for a tenant/product (None -> base). Raises RuleSetError."""
+    name = name or BASE
+    entry = _resolved.get(name)
+    if entry is None or entry[1] is None or _signature(entry[0]) != entry[1]:
+        with _lock:
+            defs, chain = _resolve(name)
+            version = hashlib.sha256(json.dumps(defs, sort_keys=True, default=str).encode()).hexdigest()[:16]
+            entry = _resolved[name] = (chain, _signature(chain), version, defs)
+    _, _, version, defs = entry
+
+    compiled = COMPILED.get(version)
+    if compiled is None:
+        with _lock:
+            compiled = COMPILED.get(version) if version in COMPILED else None  # compiled while we waited
+            if compiled is None:
+                t0 = time.perf_counter()
+                try:
+                    rules = build_rules(defs)
+                except (re.error, KeyError, TypeError) as e:
+                    raise RuleSetError(f"rule set {name}: {type(e).__name__}: {e}") from e
+                dt = time.perf_counter() - t0
+                RULESET_COMPILE_SECONDS.observe(dt, ruleset=name)
+                compiled = CompiledRuleSet(name, version, rules, dt * 1e3)
+                COMPILED.put(version, compiled)
+                log.info("compiled rule set %s (%s): %d rules in %.1fms", name, version, len(rules), dt * 1e3)
+    return compiled
+
+
+def cache_info() -> Dict[str, Any]:
+    entries = [rs.info() for _, rs in COMPILED.items()]
+    return {
+        **COMPILED.stats(),
+        "bytes": sum(e["bytes"] for e in entries),
+        "compile_ms": round(sum(e["compile_ms"] for e in entries), 2),
+        "entries": entries[::-1],  # most recently used first
+    }
@@ -9,6 +9,8 @@ class LogLine(BaseModel):
     code: Optional[str] = None
     message: str
     attrs: Dict[str, Any] = {}
+    lineno: Optional[int] = None
+    offset: Optional[int] = None
 
 class RuleHit(BaseModel):
     rule_id: str
@@ -3,6 +3,7 @@ import os, glob, joblib
 from typing import List, Dict
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.neighbors import NearestNeighbors
+from .metrics import stage
 
 BASE_DIR  = os.path.dirname(__file__)
 INDEX_DIR = os.path.join(BASE_DIR, "data")
@@ -53,6 +54,10 @@ def build_index(folder: str = None) -> int:
     return len(texts)
 
 def search(q: str, k: int = 3) -> List[Dict]:
+    with stage("sop_search"):
+        return _search(q, k)
+
+def _search(q: str, k: int) -> List[Dict]:
     _ensure_dirs()
     # If index not built or empty, return []
     if not (os.path.exists(VEC_PATH) and os.path.exists(NN_PATH)
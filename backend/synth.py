@@ -1,4 +1,5 @@
 import random, datetime as dt
+from typing import Dict, IO, Optional
 SERVICES = ["auth-service","order-service","licensing-service","inventory-service"]
 TEMPLATE = [
  ("license_expired","[ERROR] licensing-service - error detected during license check for user {id} (expired)"),
@@ -16,5 +17,135 @@ def generate(n=500, start=None):
         ts = (t + dt.timedelta(seconds=i*random.randint(1,3))).strftime("%Y-%m-%dT%H:%M:%SZ")
         out.append(gen_line(ts, random.choice(TEMPLATE)))
     return "\n".join(out)
+
+
+# ---------------------------
+# Large-scale streaming generator (parser-compatible format, see parser.TS_RGX)
+# ---------------------------
+# Known-error templates match rules.yaml; unknown ones exercise ML fallback and clustering.
+KNOWN_ERRORS = [
+    "Database connection timed out after {n}s",
+    "Database connection refused",
+    "DB timed out for endpoint /user/{n}",
+    "authentication failed for user user{n}@example.com",
+    "login failed: invalid credentials for user{n}",
+    "license expired for org_id={n}",
+    "License validation failed: expired token",
+    "NoneType object has no attribute 'id'",
+    "NullPointerException while processing item {n}",
+    "503 Service Unavailable on POST /api/orders/{n}",
+    "write failed: No space left on device",
+]
+UNKNOWN_ERRORS = [
+    "Payment gateway returned 401 Unauthorized",
+    "upstream 502 Bad Gateway from shipping-service",
+    "Job invoice_sync failed permanently: HTTP 504",
+    "IndexError: list index out of range",
+    "division by zero in metrics aggregation",
+    "KafkaTimeoutError: batch for topic events-{n} expired",
+]
+INFOS = [
+    "Request started for /login",
+    "Response 200 OK /login user=user{n}",
+    "Healthcheck passed (latency={n}ms)",
+    "cleanup finished successfully",
+    "processed {n} transactions successfully",
+    "Cache warmup complete",
+]
+WARNS = [
+    "Slow query detected: SELECT * FROM orders WHERE id = {n}",
+    "Retry #{n} for job=invoice_sync",
+    "High latency detected: {n}ms",
+    "cache miss ratio {n}%",
+]
+STACK_FRAMES = [
+    "    at com.acme.{svc}.Handler.process(Handler.java:{n})",
+    "    at com.acme.{svc}.Service.run(Service.java:{n})",
+    "    at java.base/java.lang.Thread.run(Thread.java:833)",
+    "Caused by: java.net.SocketTimeoutException: Read timed out",
+    '  File "/srv/{svc}/worker.py", line {n}, in handle',
+]
+DEFAULT_MIX = {"info": 0.70, "warn": 0.18, "known": 0.08, "unknown": 0.04}
+
+
+def stream_log(
+    out: IO[str],
+    size_bytes: Optional[int] = None,
+    lines: Optional[int] = None,
+    services: int = 8,
+    mix: Optional[Dict[str, float]] = None,
+    burst_rate: float = 0.05,
+    burst_factor: float = 10.0,
+    stack_ratio: float = 0.1,
+    lines_per_minute: int = 600,
+    seed: int = 42,
+    start: Optional[dt.datetime] = None,
+    chunk_lines: int = 20000,
+) -> Dict[str, int]:
+    """
+    Write a synthetic log straight to `out` until size_bytes or lines is reached.
+    - services: number of distinct service/host pairs
+    - mix: weights for info/warn/known/unknown records (DEFAULT_MIX)
+    - burst_rate: fraction of minutes whose error weight is multiplied by burst_factor
+    - stack_ratio: fraction of ERROR records followed by a multi-line stack trace
+    Returns {"bytes", "lines", "records"}. Output is deterministic for a given seed.
+    """
+    if size_bytes is None and lines is None:
+        raise ValueError("size_bytes or lines is required")
+    rnd = random.Random(seed)
+    mix = {**DEFAULT_MIX, **(mix or {})}
+    start = start or dt.datetime(2025, 10, 15, 0, 0, 0)
+    svcs = [(f"svc-{i:02d}", f"host{i % 16}") for i in range(services)]
+    kinds = ["info", "warn", "known", "unknown"]
+    pools = {"info": ("INFO", INFOS), "warn": ("WARN", WARNS), "known": ("ERROR", KNOWN_ERRORS),
+             "unknown": ("ERROR", UNKNOWN_ERRORS)}
+    normal_w = [mix[k] for k in kinds]
+    burst_w = [mix["info"], mix["warn"], mix["known"] * burst_factor, mix["unknown"] * burst_factor]
+
+    n_bytes = n_lines = n_records = 0
+    sec_per_line = 60.0 / max(1, lines_per_minute)
+    t = 0.0
+    ts_cache_sec, ts_str = -1, ""
+    minute, weights = -1, normal_w
+    buf = []
+    while (size_bytes is None or n_bytes < size_bytes) and (lines is None or n_lines < lines):
+        # draw a block of records at once; random.choices is much cheaper in bulk
+        block = rnd.choices(kinds, weights=weights, k=256)
+        for kind in block:
+            sec = int(t)
+            if sec // 60 != minute:
+                minute = sec // 60
+                weights = burst_w if rnd.random() < burst_rate else normal_w
+            if sec != ts_cache_sec:
+                ts_cache_sec = sec
+                ts_str = (start + dt.timedelta(seconds=sec)).strftime("%Y-%m-%dT%H:%M:%SZ")
+            t += sec_per_line
+            level, pool = pools[kind]
+            svc, host = svcs[rnd.randrange(len(svcs))]
+            msg = pool[rnd.randrange(len(pool))]
+            if "{n}" in msg:
+                msg = msg.replace("{n}", str(rnd.randrange(1, 10000)))
+            rec = f"{ts_str} [{level}] {svc} {host} - {msg}"
+            buf.append(rec)
+            n_records += 1
+            n_lines += 1
+            n_bytes += len(rec) + 1
+            if level == "ERROR" and rnd.random() < stack_ratio:
+                for _ in range(rnd.randint(3, 12)):
+                    frame = STACK_FRAMES[rnd.randrange(len(STACK_FRAMES))]
+                    frame = frame.replace("{svc}", svc.replace("-", "_")).replace("{n}", str(rnd.randrange(1, 900)))
+                    buf.append(frame)
+                    n_lines += 1
+                    n_bytes += len(frame) + 1
+            if (size_bytes is not None and n_bytes >= size_bytes) or (lines is not None and n_lines >= lines):
+                break
+        if len(buf) >= chunk_lines:
+            out.write("\n".join(buf) + "\n")
+            buf.clear()
+    if buf:
+        out.write("\n".join(buf) + "\n")
+    return {"bytes": n_bytes, "lines": n_lines, "records": n_records}
+
+
 if __name__ == "__main__":
-    print(generate())
\ No newline at end of file
+    print(generate())